@@ -1,8 +1,13 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import os
 import datetime
+import io
 import re
+import struct
+from typing import NamedTuple, Optional
 
-import fleep
+import flask
 
 try:
     import urlparse
@@ -15,6 +20,14 @@ from .s3 import S3ResponseError, get_file_size
 BAD_SUPPLIER_NAME_CHARACTERS = ['#', '%', '&', '{', '}', '\\', '<', '>', '*', '?', '/', '$',
                                 '!', "'", '"', ':', '@', '+', '`', '|', '=', ',', '.']
 
+# supplier names are sanitised as ASCII bytes, so they can be translated with a single pass over a 256-byte table.
+# spaces become underscores and ampersands 'and' (separately), and the rest of BAD_SUPPLIER_NAME_CHARACTERS are removed
+_SUPPLIER_NAME_TRANSLATION = bytes.maketrans(b' ', b'_')
+_SUPPLIER_NAME_DELETIONS = ''.join(char for char in BAD_SUPPLIER_NAME_CHARACTERS if char != '&').encode('ascii')
+# the ASCII characters str.strip() removes, which include some bytes.strip() doesn't
+_ASCII_WHITESPACE = ''.join(char for char in map(chr, range(128)) if char.isspace()).encode('ascii')
+_REPEATED_UNDERSCORES = re.compile(rb'_{2,}')
+
 RESULT_LETTER_FILENAME = 'result-letter.pdf'
 
 AGREEMENT_FILENAME = 'framework-agreement.pdf'
@@ -25,6 +38,85 @@ SIGNED_SIGNATURE_PAGE_PREFIX = 'signed-signature-page'
 
 COUNTERPART_FILENAME = "agreement-countersignature.pdf"
 
+# maximum size of an uploaded document, approximately 5Mb
+DOCUMENT_SIZE_LIMIT = 5400000
+
+OPEN_DOCUMENT_FORMAT_EXTENSIONS = (".pdf", ".odt", ".ods", ".odp")
+
+
+class DocumentValidationError(ValueError):
+    """
+    Raised when a document fails validation, ``validator`` being the name of the failed validator as used to look up
+    the error message in the question content
+    """
+    def __init__(self, validator):
+        super().__init__(validator)
+        self.validator = validator
+
+
+class ValidatingDocumentStream(io.RawIOBase):
+    """
+    Read-only wrapper around an uploaded document which validates it in a single pass as it is read (i.e. uploaded),
+    rather than seeking around and re-reading it beforehand.
+
+    The first 128 bytes are read once on construction, to check whether the document is empty and to sniff its format
+    - an invalid format raises ``DocumentValidationError`` immediately. Those bytes are then replayed to the reader.
+    As the rest is read the size limit is enforced, a read passing the limit raising ``DocumentValidationError`` to
+    abort the upload there and then.
+
+    Seeking (e.g. by an uploader finding the document's length, or rewinding to retry) is supported.
+    """
+    def __init__(self, file_object, allowed_extensions=OPEN_DOCUMENT_FORMAT_EXTENSIONS, max_size=DOCUMENT_SIZE_LIMIT):
+        self._file = file_object
+        self.filename = file_object.filename
+        self.max_size = max_size
+
+        self._file.seek(0)
+        self._header = self._file.read(128)
+        self._pos = 0
+
+        extension = get_extension(self.filename)
+        if self._header and not (
+            extension in allowed_extensions and _header_matches_extension(self._header, extension)
+        ):
+            raise DocumentValidationError("file_is_open_document_format")
+
+    @property
+    def is_empty(self):
+        return not self._header
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            self._file.seek(0, io.SEEK_END)
+            offset += self._file.tell()
+
+        self._pos = offset
+        self._file.seek(max(offset, len(self._header)))
+        return self._pos
+
+    def readinto(self, b):
+        data = self._header[self._pos:self._pos + len(b)]
+        if len(data) < len(b):
+            data += self._file.read(len(b) - len(data))
+
+        if data and self._pos + len(data) >= self.max_size:
+            raise DocumentValidationError("file_is_less_than_5mb")
+
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
 
 def filter_empty_files(files):
     """Remove any empty files from the list.
@@ -62,7 +154,8 @@ def validate_documents(files):
     return errors
 
 
-def upload_document(uploader, upload_type, documents_url, service, field, file_contents, public=True):
+def upload_document(uploader, upload_type, documents_url, service, field, file_contents, public=True,
+                    deduplicate=False):
     """Upload the document to S3 bucket and return the document URL
 
     :param uploader: S3 uploader object
@@ -76,6 +169,8 @@ def upload_document(uploader, upload_type, documents_url, service, field, file_c
     :param file_contents: attached file object
     :param public: if True, set file permission to 'public-read'. Otherwise 'bucket-owner-full-control',
                    which is private to the object owner and bucket owner.
+    :param deduplicate: if True, don't upload a new copy of a document whose contents are unchanged from the
+                        latest version already uploaded for this field, returning that version's URL instead
 
     :return: generated document URL or ``False`` if document upload
              failed
@@ -95,38 +190,70 @@ def upload_document(uploader, upload_type, documents_url, service, field, file_c
 
     acl = 'public-read' if public else 'bucket-owner-full-control'
 
+    save_kwargs = {}
+    if deduplicate:
+        # all versions of this document share the file name generated without a timestamp suffix (minus extension)
+        save_kwargs["dedupe_prefix"] = os.path.splitext(generate_file_name(
+            service['frameworkSlug'],
+            upload_type,
+            service['supplierId'],
+            service.get('id'),
+            field,
+            file_contents.filename,
+            suffix="",
+        ))[0]
+
     try:
-        uploader.save(file_path, file_contents, acl=acl)
+        key = uploader.save(file_path, file_contents, acl=acl, **save_kwargs)
     except S3ResponseError:
         return False
 
     full_url = urlparse.urljoin(
         documents_url,
-        file_path
+        key["path"] if deduplicate else file_path
     )
 
     return full_url
 
 
 def upload_declaration_documents(
-    uploader, upload_type, documents_url, request_files, section, framework_slug, supplier_id, public=True
+    uploader, upload_type, documents_url, request_files, section, framework_slug, supplier_id, public=True,
+    deduplicate=False, single_pass=False, max_workers=None,
 ):
     # Provide a pseudo 'service' without a Service ID, to construct the filename
     return upload_service_documents(
         uploader, upload_type, documents_url,
         {"frameworkSlug": framework_slug, "supplierId": supplier_id},
-        request_files, section, public=public
+        request_files, section, public=public, deduplicate=deduplicate, single_pass=single_pass,
+        max_workers=max_workers,
     )
 
 
-def upload_service_documents(uploader, upload_type, documents_url, service, request_files, section, public=True):
+def upload_service_documents(uploader, upload_type, documents_url, service, request_files, section, public=True,
+                             deduplicate=False, single_pass=False, max_workers=None):
+    """Validate and upload the documents in ``request_files`` for the upload questions in ``section``
+
+    :param single_pass: if True, validate each document as it is uploaded (see ``ValidatingDocumentStream``) rather
+                        than reading through each of them beforehand. documents uploaded before another is found to
+                        exceed the size limit are left in place, though as with any validation error no URLs are
+                        returned. with ``deduplicate`` each document is still read once more beforehand, as its
+                        digest is needed before deciding whether to upload it.
+    :param max_workers: if set, upload the documents concurrently from a pool of at most this many threads rather
+                        than one after another
+
+    :return: tuple of a dictionary of uploaded document URLs (or ``None`` if there were validation errors) and a
+             dictionary of errors, both keyed by field
+    """
     if upload_type not in ('documents', 'submissions',):
         raise ValueError(f"Unexpected upload_type {upload_type!r}")
 
     files = {field: request_files[field] for field in section.get_question_ids(type="upload")
              if field in request_files}
-    files = filter_empty_files(files)
-    errors = validate_documents(files)
+    if single_pass:
+        files, errors = _get_validating_streams(files)
+    else:
+        files = filter_empty_files(files)
+        errors = validate_documents(files)
 
     if errors:
         return None, errors
@@ -134,19 +261,72 @@ def upload_service_documents(uploader, upload_type, documents_url, service, requ
     if len(files) == 0:
         return {}, {}
 
-    for field, contents in files.items():
-        url = upload_document(
-            uploader, upload_type, documents_url, service, field, contents,
-            public=public)
-
-        if not url:
+    results = _upload_documents(
+        uploader, upload_type, documents_url, service, files, public, deduplicate, max_workers,
+    )
+    for field, result in results.items():
+        if isinstance(result, DocumentValidationError):
+            errors[field] = result.validator
+        elif not result:
             errors[field] = 'file_can_be_saved'
         else:
-            files[field] = url
+            files[field] = result
+
+    if any(error != 'file_can_be_saved' for error in errors.values()):
+        return None, errors
 
     return files, errors
 
 
+def _upload_documents(uploader, upload_type, documents_url, service, files, public, deduplicate, max_workers):
+    """
+    Upload each of ``files``, concurrently if ``max_workers`` is set
+
+    :return: dictionary, keyed by field, of the results of ``upload_document`` or the ``DocumentValidationError``
+             raised while uploading
+    """
+    def _upload(field):
+        try:
+            return upload_document(
+                uploader, upload_type, documents_url, service, field, files[field],
+                public=public, deduplicate=deduplicate)
+        except DocumentValidationError as e:
+            return e
+
+    if max_workers and len(files) > 1:
+        uploads = [partial(_upload, field) for field in files]
+        if flask.has_request_context():
+            # so the uploads' S3 requests are logged as part of this request, as they would be done sequentially. each
+            # needs its own copy of the context, as a copy can't be pushed in more than one thread at once
+            uploads = [flask.copy_current_request_context(upload) for upload in uploads]
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            # executor.map preserves the ordering of its input
+            return dict(zip(files, executor.map(lambda upload: upload(), uploads)))
+
+    return {field: _upload(field) for field in files}
+
+
+def _get_validating_streams(files):
+    """
+    Wrap each of ``files`` in a ``ValidatingDocumentStream``, dropping empty files
+
+    :return: tuple of a dictionary of the streams and a dictionary of errors, both keyed by field
+    """
+    streams, errors = {}, {}
+    for field, contents in files.items():
+        try:
+            stream = ValidatingDocumentStream(contents)
+        except DocumentValidationError as e:
+            errors[field] = e.validator
+            continue
+
+        if not stream.is_empty:
+            streams[field] = stream
+
+    return streams, errors
+
+
 def file_is_not_empty(file_contents):
     return not file_is_empty(file_contents)
 
@@ -156,7 +336,7 @@ def file_is_empty(file_object):
 
 
 def file_is_less_than_5mb(file_):
-    return get_file_size(file_) < 5400000
+    return get_file_size(file_) < DOCUMENT_SIZE_LIMIT
 
 
 def get_first_128_bytes(file_object):
@@ -173,36 +353,160 @@ def get_extension(filename):
     return file_extension.lower()
 
 
-def get_possible_extensions_from_format(file_object):
+# the leading "magic bytes" of the binary file formats we accept, keyed by their extension
+FORMAT_SIGNATURES = {
+    "pdf": (b"%PDF",),
+    "jpg": (b"\xff\xd8\xff",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "zip": (b"PK\x03\x04", b"PK\x05\x06", b"PK\x07\x08"),
+}
+
+# the leading "magic bytes" of other common binary file formats, which we don't accept but need to tell apart from a CSV
+OTHER_FORMAT_SIGNATURES = {
+    "gif": (b"GIF8",),
+    "bmp": (b"BM",),
+    "tiff": (b"I I", b"II*\x00", b"MM\x00*", b"MM\x00+"),
+    "doc": (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",),  # also xls and ppt
+    "rtf": (b"{\\rtf1",),
+    "gz": (b"\x1f\x8b\x08",),
+    "7z": (b"7z\xbc\xaf\x27\x1c",),
+    "rar": (b"Rar!\x1a\x07\x00", b"Rar!\x1a\x07\x01\x00"),
+    "exe": (b"MZ\x90\x00",),
+    "sqlite": (b"SQLite format 3\x00",),
+    "psd": (b"8BPS",),
+    "ico": (b"\x00\x00\x01\x00",),
+    "eps": (b"\xc5\xd0\xd3\xc6", b"%!PS-Adobe"),
+    "mp3": (b"ID3", b"\xff\xfb"),
+    "wav": (b"RIFF",),  # also avi and webp
+    "aiff": (b"FORM\x00",),
+    "flac": (b"fLaC",),
+    "ogg": (b"OggS",),
+    "mid": (b"MThd",),
+    "au": (b".snd",),
+    "amr": (b"#!AMR",),
+    "mpg": (b"\x00\x00\x01\xba", b"\x00\x00\x01\xb3"),  # also vob
+    "wmv": (b"0&\xb2u\x8ef\xcf\x11",),  # also asf and wma
+    "webm": (b"\x1aE\xdf\xa3",),  # also mkv
+    "flv": (b"FLV",),
+    "swf": (b"FWS", b"CWS"),
+    "xz": (b"\xfd7zXZ\x00",),
+    "tar.z": (b"\x1f\x9d", b"\x1f\xa0"),
+    "cab": (b"MSCF",),
+    "otf": (b"OTTO",),
+    "woff": (b"wOFF", b"wOF2"),
+}
+
+# signatures which start part-way into a file, as (offset, signature) pairs
+OTHER_FORMAT_OFFSET_SIGNATURES = {
+    "mp4": ((4, b"ftyp"),),  # also mov, m4a, m4v and 3gp
+    "xml": ((2, b"xml"),),  # i.e. "<?xml"
+}
+
+# OpenDocument files are zip files whose first entry is an uncompressed file named "mimetype" containing one of these
+OPEN_DOCUMENT_MIMETYPES = {
+    b"application/vnd.oasis.opendocument.text": "odt",
+    b"application/vnd.oasis.opendocument.spreadsheet": "ods",
+    b"application/vnd.oasis.opendocument.presentation": "odp",
+}
+
+_ZIP_LOCAL_FILE_HEADER = b"PK\x03\x04"
+# compression method, compressed size, file name length and extra field length from a zip local file header
+_ZIP_LOCAL_FILE_HEADER_FIELDS = struct.Struct("<8xH8xI4xHH")
+_ZIP_LOCAL_FILE_NAME_OFFSET = 30
+_ODF_MIMETYPE_ENTRY_NAME = b"mimetype"
+
+
+def _build_signature_table(format_signatures):
+    """Group signatures by their first byte so detection only has to compare a header against a handful of them"""
+    table = {}
+    for extension, signatures in format_signatures.items():
+        for signature in signatures:
+            table.setdefault(signature[0], []).append((signature, extension))
+
+    return {first_byte: tuple(entries) for first_byte, entries in table.items()}
+
+
+_SIGNATURE_TABLE = _build_signature_table(FORMAT_SIGNATURES)
+_ANY_FORMAT_SIGNATURE_TABLE = _build_signature_table({**FORMAT_SIGNATURES, **OTHER_FORMAT_SIGNATURES})
+
+
+def _get_open_document_extension(header):
+    """Return the OpenDocument extension declared by the "mimetype" entry at the start of a zip header, or None"""
+    if not header.startswith(_ZIP_LOCAL_FILE_HEADER) or len(header) < _ZIP_LOCAL_FILE_NAME_OFFSET:
+        return None
+
+    compression, size, name_length, extra_length = _ZIP_LOCAL_FILE_HEADER_FIELDS.unpack_from(header)
+    name_end = _ZIP_LOCAL_FILE_NAME_OFFSET + name_length
+    if compression != 0 or header[_ZIP_LOCAL_FILE_NAME_OFFSET:name_end] != _ODF_MIMETYPE_ENTRY_NAME:
+        return None
+
+    content_start = name_end + extra_length
+    return OPEN_DOCUMENT_MIMETYPES.get(header[content_start:content_start + size])
+
+
+def get_possible_extensions_from_header(header):
+    """
+    Identify which of the file formats we accept a file header could belong to. Only formats with signatures are
+    recognised - anything else (CSV included) gives an empty list.
+
+    :param header: bytes from the start of a file. 128 bytes are enough for all the formats we accept.
+    :return: list(str): Possible file formats. An OpenDocument file is also a valid zip file, so is reported as both.
     """
-    Pass the first 128 bytes from the file object to fleep for a list of possible extensions
+    if not header:
+        return []
 
-    We don't need to load the whole file into memory to let fleep determine the file type. Apparently the first 128
-    bytes are sufficient: https://github.com/floyernick/fleep-py/blob/994bc2c274482d80ab13d89d8f7343eb316d3e44/
-        fleep/__init__.py#L55
+    extensions = [
+        extension for signature, extension in _SIGNATURE_TABLE.get(header[0], ()) if header.startswith(signature)
+    ]
+    if "zip" in extensions:
+        open_document_extension = _get_open_document_extension(header)
+        if open_document_extension:
+            extensions.insert(0, open_document_extension)
+
+    return extensions
+
+
+def get_possible_extensions_from_format(file_object):
+    """
+    Get a list of possible extensions from the first 128 bytes of the file object
 
     :param file_object: File object open as bytes.
     :return: list(str): Possible file formats.
     """
-    return fleep.get(get_first_128_bytes(file_object)).extension
+    return get_possible_extensions_from_header(get_first_128_bytes(file_object))
 
 
 def extension_matches_possible_file_formats(file_object, extension):
     """
-    Pass the first 128 bytes from the file object to fleep and the supplied extension.
+    Check the supplied extension against the possible formats of the first 128 bytes of the file object.
 
     :param file_object: File object open as bytes.
-    :param extension: File object open as bytes.
+    :param extension: File extension, with or without a leading dot.
     :return: boolean: Does extension match guess at format?
     """
-    return fleep.get(get_first_128_bytes(file_object)).extension_matches(extension.strip('.'))
+    return _header_matches_extension(get_first_128_bytes(file_object), extension)
+
+
+def _header_matches_extension(header, extension):
+    return extension.strip('.') in get_possible_extensions_from_header(header)
+
+
+def _header_has_known_signature(header):
+    return bool(header) and (
+        any(header.startswith(signature) for signature, _ in _ANY_FORMAT_SIGNATURE_TABLE.get(header[0], ()))
+        or any(
+            header.startswith(signature, offset)
+            for signatures in OTHER_FORMAT_OFFSET_SIGNATURES.values()
+            for offset, signature in signatures
+        )
+    )
 
 
 def file_is_open_document_format(file_object):
     extension = get_extension(file_object.filename)
 
     return (
-        extension in [".pdf", ".odt", ".ods", ".odp"]
+        extension in OPEN_DOCUMENT_FORMAT_EXTENSIONS
         and extension_matches_possible_file_formats(file_object, extension)
     )
 
@@ -215,10 +519,19 @@ def file_is_pdf(file_object):
 
 
 def file_is_csv(file_object):
-    """Checks file extension as being CSV and checks format does not match something other than CSV."""
+    """
+    Checks file extension as being CSV and checks format does not match something other than CSV.
+
+    Any encoding of text is accepted, so the check is only as good as our list of the signatures of other common
+    formats - a file in a binary format we don't have the signature of (e.g. a camera raw image or a 3D model) will
+    pass as a CSV.
+    """
     extension = get_extension(file_object.filename)
 
-    return extension == ".csv" and get_possible_extensions_from_format(file_object) == []
+    if extension != ".csv":
+        return False
+
+    return not _header_has_known_signature(get_first_128_bytes(file_object))
 
 
 def file_is_zip(file_object):
@@ -274,13 +587,33 @@ def default_file_suffix():
     return datetime.datetime.utcnow().strftime("%Y-%m-%d-%H%M")
 
 
-def get_signed_url(bucket, path, base_url):
-    url = bucket.get_signed_url(path)
+def get_signed_url(bucket, path, base_url, expires_in=30, signed_url_cache=None):
+    """Create a signed URL for a document, optionally served from a different base URL
+
+    :param bucket: S3 object for the bucket containing the document
+    :param path: document path within the bucket
+    :param base_url: if not ``None``, scheme and host to use in place of S3's
+    :param expires_in: how long the generated URL is valid for, in seconds
+    :param signed_url_cache: optional ``dmutils.s3.SignedURLCache`` from which a previously
+                             signed URL may be reused while it has enough validity left
+
+    :return: signed URL or ``None`` if the document was not found
+
+    """
+    if signed_url_cache is not None:
+        cache_key = (bucket.bucket_name, path, expires_in, base_url)
+        url = signed_url_cache.get(cache_key)
+        if url is not None:
+            return url
+
+    url = bucket.get_signed_url(path, expires_in=expires_in)
     if url is not None:
         if base_url is not None:
             url = urlparse.urlparse(url)
             base_url = urlparse.urlparse(base_url)
             url = url._replace(netloc=base_url.netloc, scheme=base_url.scheme).geturl()
+        if signed_url_cache is not None:
+            signed_url_cache.set(cache_key, url, expires_in)
         return url
 
 
@@ -323,13 +656,12 @@ def degenerate_document_path_and_return_doc_name(document_path):
 
 def sanitise_supplier_name(supplier_name):
     """Replace ampersands with 'and' and spaces with a single underscore."""
-    sanitised_supplier_name = supplier_name.encode("ascii", errors="ignore").decode("ascii").strip()
-    sanitised_supplier_name = sanitised_supplier_name.replace(' ', '_').replace('&', 'and')
-    for bad_char in BAD_SUPPLIER_NAME_CHARACTERS:
-        sanitised_supplier_name = sanitised_supplier_name.replace(bad_char, '')
-    while '__' in sanitised_supplier_name:
-        sanitised_supplier_name = sanitised_supplier_name.replace('__', '_')
-    return sanitised_supplier_name
+    sanitised_supplier_name = supplier_name.encode("ascii", errors="ignore").strip(_ASCII_WHITESPACE).replace(
+        b'&', b'and'
+    ).translate(_SUPPLIER_NAME_TRANSLATION, _SUPPLIER_NAME_DELETIONS)
+    if b'__' in sanitised_supplier_name:
+        sanitised_supplier_name = _REPEATED_UNDERSCORES.sub(b'_', sanitised_supplier_name)
+    return sanitised_supplier_name.decode("ascii")
 
 
 def generate_download_filename(supplier_id, document_name, supplier_name):
@@ -338,3 +670,82 @@ def generate_download_filename(supplier_id, document_name, supplier_name):
         such as framework agreement documents, that suppliers need to download
     """
     return '{}-{}-{}'.format(sanitise_supplier_name(supplier_name), supplier_id, document_name)
+
+
+class PlannedDocument(NamedTuple):
+    supplier_id: int
+    path: str
+    download_filename: str
+    signed_url: Optional[str] = None
+
+
+def plan_supplier_documents(
+    framework_slug,
+    suppliers,
+    bucket_category,
+    document_name,
+    timestamped=False,
+    bucket=None,
+    base_url=None,
+    expires_in=30,
+    signed_url_cache=None,
+    max_workers=None,
+):
+    """
+    Plan a framework-wide job creating or serving a document (e.g. a result letter or framework agreement) for each
+    of a number of suppliers, equivalent to calling ``get_document_path`` (or
+    ``generate_timestamped_document_upload_path``), ``generate_download_filename`` and optionally ``get_signed_url``
+    for each of them.
+
+    :param framework_slug: slug of the framework the documents belong to
+    :param suppliers: iterable of supplier dicts with ``supplierId`` and ``supplierName`` keys, such as those from the
+                      API's list of suppliers on a framework
+    :param bucket_category: e.g. 'agreements' or 'documents'
+    :param document_name: e.g. ``RESULT_LETTER_FILENAME``
+    :param timestamped: insert a timestamp before the extension in each document's path, as for uploads. The same
+                        timestamp is used for every supplier, and download filenames are left without it.
+    :param bucket: if given, S3 object used to sign a URL for each document. Documents which aren't found in the
+                   bucket will have a ``signed_url`` of ``None``.
+    :param base_url: as for ``get_signed_url``
+    :param expires_in: as for ``get_signed_url``
+    :param signed_url_cache: as for ``get_signed_url``
+    :param max_workers: number of threads to sign URLs with. by default URLs are signed in turn
+
+    :return: iterator of ``PlannedDocument``s, in the same order as ``suppliers``
+    """
+    path_document_name = document_name
+    if timestamped:
+        file_name, file_extension = os.path.splitext(document_name)
+        path_document_name = '{}-{}{}'.format(
+            file_name, datetime.datetime.utcnow().strftime("%Y-%m-%d-%H%M%S"), file_extension
+        )
+
+    # the equivalent of get_document_path and generate_download_filename, with the parts common to every supplier
+    # formatted once
+    path_prefix = '{}/{}/'.format(framework_slug, bucket_category)
+
+    def _plan():
+        for supplier in suppliers:
+            supplier_id = supplier["supplierId"]
+            yield PlannedDocument(
+                supplier_id,
+                f'{path_prefix}{supplier_id}/{supplier_id}-{path_document_name}',
+                f'{sanitise_supplier_name(supplier["supplierName"])}-{supplier_id}-{document_name}',
+            )
+
+    planned_documents = _plan()
+    if bucket is None:
+        return planned_documents
+
+    def _sign(planned_document):
+        return planned_document._replace(
+            signed_url=get_signed_url(
+                bucket, planned_document.path, base_url, expires_in=expires_in, signed_url_cache=signed_url_cache,
+            ),
+        )
+
+    if max_workers:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return iter(list(executor.map(_sign, planned_documents)))
+
+    return map(_sign, planned_documents)
@@ -2,7 +2,7 @@ from collections import OrderedDict
 import os
 from types import MappingProxyType
 
-from dmutils import config, logging, proxy_fix, request_id, formats, filters, cookie_probe
+from dmutils import config, logging, proxy_fix, request_body_limit, request_id, formats, filters, cookie_probe
 from dmutils.errors import api as api_errors, frontend as fe_errors
 from dmutils.urls import SafePurePathConverter
 import dmutils.session
@@ -51,6 +51,8 @@ def init_app(
     # all belong to dmutils
     config.init_app(application)
     logging.init_app(application)
+    # applied before (so runs inside) proxy_fix, to route requests by their forwarded host
+    request_body_limit.init_app(application)
     proxy_fix.init_app(application)
     request_id.init_app(application)
     cookie_probe.init_app(application)
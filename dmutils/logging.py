@@ -1,11 +1,18 @@
 from __future__ import absolute_import
+import atexit
+from collections import Counter
+import copy
 import logging
+import logging.handlers
+import queue
 import sys
 import re
 from os import getpid
 import os.path
+import threading
 from threading import get_ident as get_thread_ident
 import time
+import weakref
 
 from flask import request, current_app
 from flask.ctx import has_request_context
@@ -26,6 +33,16 @@ LOG_FORMAT_EXTRA_JSON_KEYS = (
 )
 
 
+LOG_QUEUE_OVERFLOW_BLOCK = "block"
+LOG_QUEUE_OVERFLOW_DROP_DEBUG = "drop-debug"
+LOG_QUEUE_OVERFLOW_DROP_OLDEST = "drop-oldest"
+LOG_QUEUE_OVERFLOW_POLICIES = (
+    LOG_QUEUE_OVERFLOW_BLOCK,
+    LOG_QUEUE_OVERFLOW_DROP_DEBUG,
+    LOG_QUEUE_OVERFLOW_DROP_OLDEST,
+)
+
+
 logger = logging.getLogger(__name__)
 
 
@@ -48,6 +65,9 @@ def _common_request_extra_log_context():
 def init_app(app):
     app.config.setdefault('DM_LOG_LEVEL', 'INFO')
     app.config.setdefault('DM_APP_NAME', 'none')
+    app.config.setdefault('DM_LOG_QUEUE', False)
+    app.config.setdefault('DM_LOG_QUEUE_SIZE', 10000)
+    app.config.setdefault('DM_LOG_QUEUE_OVERFLOW', LOG_QUEUE_OVERFLOW_BLOCK)
 
     @app.before_request
     def before_request():
@@ -97,8 +117,12 @@ def init_app(app):
     if app.config.get('DM_LOG_PATH'):
         handlers.append(logging.FileHandler(app.config['DM_LOG_PATH']))
 
+    if app.config['DM_LOG_QUEUE']:
+        handlers = [_start_log_queue(app, handlers, formatter)]
+
+    enrichment_filter = get_enrichment_filter(app)
     for handler in handlers:
-        configure_handler(handler, app, formatter)
+        configure_handler(handler, app, formatter, enrichment_filter=enrichment_filter)
 
     loglevel = logging.getLevelName(app.config['DM_LOG_LEVEL'])
     loggers = [
@@ -119,22 +143,96 @@ def init_app(app):
     app.logger.info('Logging configured')
 
 
-def configure_handler(handler, app, formatter):
+def get_enrichment_filter(app):
+    filters = [
+        AppNameFilter(app.config['DM_APP_NAME']),
+        RequestExtraContextFilter(),
+        AppStackLocationFilter("app_", app.root_path),
+    ]
+    if os.environ.get('CF_INSTANCE_INDEX'):
+        filters.append(AppInstanceFilter())
+
+    return EnrichmentFilter(filters)
+
+
+def configure_handler(handler, app, formatter, enrichment_filter=None):
+    """
+    Configure ``handler`` with ``formatter`` and our filters. Pass the same ``enrichment_filter`` (from
+    ``get_enrichment_filter``) when configuring several handlers for an app, so records are only enriched once.
+    """
     handler.setLevel(logging.getLevelName(app.config['DM_LOG_LEVEL']))
     handler.setFormatter(formatter)
-    handler.addFilter(AppNameFilter(app.config['DM_APP_NAME']))
-    handler.addFilter(RequestExtraContextFilter())
-    handler.addFilter(AppStackLocationFilter("app_", app.root_path))
-    if os.environ.get('CF_INSTANCE_INDEX'):
-        handler.addFilter(AppInstanceFilter())
+    handler.addFilter(enrichment_filter or get_enrichment_filter(app))
 
     return handler
 
 
+def _start_log_queue(app, handlers, formatter):
+    """
+    Start a thread to format and write records to ``handlers``, returning the ``DMQueueHandler`` feeding it, which
+    should be configured with our filters (they need to run in the thread which logged the record, to see its request
+    context and stack)
+    """
+    # replacing any previous pipeline for this app, e.g. in tests
+    previous_queue_handler = app.extensions.get("dm_log_queue_handler")
+    if previous_queue_handler is not None:
+        previous_queue_handler.stop()
+
+    for handler in handlers:
+        handler.setLevel(logging.getLevelName(app.config['DM_LOG_LEVEL']))
+        handler.setFormatter(formatter)
+
+    queue_handler = DMQueueHandler(
+        queue.Queue(app.config['DM_LOG_QUEUE_SIZE']),
+        handlers,
+        overflow=app.config['DM_LOG_QUEUE_OVERFLOW'],
+    )
+    queue_handler.start()
+    app.extensions["dm_log_queue_handler"] = queue_handler
+
+    return queue_handler
+
+
 def get_json_log_format():
     return LOG_FORMAT + "".join(f" %({key})s" for key in LOG_FORMAT_EXTRA_JSON_KEYS)
 
 
+class EnrichmentFilter(logging.Filter):
+    """
+        Filter applying each of ``filters`` to a record. When shared between handlers, it only does so the first time
+        it sees each record - walking the stack and fetching request context once per record rather than per handler.
+    """
+    def __init__(self, filters):
+        self.filters = tuple(filters)
+
+    def filter(self, record):
+        # (underscore-prefixed attributes aren't included in our json log output)
+        if record.__dict__.get("_dm_enriched_by") is not self:
+            for filter_ in self.filters:
+                filter_.filter(record)
+            record._dm_enriched_by = self
+
+        return record
+
+
+class FormatOncePerRecordMixin:
+    """
+        Formatter mixin which reuses a record's formatted output when it is passed to another handler sharing the
+        same formatter. Subclasses wanting to customize formatting should override ``format_record``.
+    """
+    def format(self, record):
+        formatted = record.__dict__.get("_dm_formatted")
+        if formatted is not None and formatted[0] is self:
+            return formatted[1]
+
+        msg = self.format_record(record)
+        record._dm_formatted = (self, msg)
+        return msg
+
+    def format_record(self, record):
+        return super().format(record)
+
+
 class AppNameFilter(logging.Filter):
     def __init__(self, app_name):
         self.app_name = app_name
@@ -208,21 +306,170 @@ class AppStackLocationFilter(BaseExtraStackLocationFilter):
     """
     def __init__(self, param_prefix, file_path_prefix):
         self._file_path_prefix = os.path.normcase(file_path_prefix)
+        # memo of each code filename's is_interesting_frame result, so walking the stack costs a dict lookup per frame
+        self._is_app_filename = {}
         super().__init__(param_prefix)
 
     def is_interesting_frame(self, frame):
-        filename = os.path.normcase(frame.f_code.co_filename)
-        return os.path.commonpath(
+        filename = frame.f_code.co_filename
+        try:
+            return self._is_app_filename[filename]
+        except KeyError:
+            pass
+
+        is_app_filename = os.path.commonpath(
             # regarding abspath here: there is a possibility due to https://bugs.python.org/issue20443 that absolutizing
             # these file paths won't work correctly if our python process has done a chdir. I don't think we generally
-            # do that but a better solution might be to outlaw relative imports.
-            (os.path.abspath(self._file_path_prefix), os.path.abspath(filename))
+            # do that but a better solution might be to outlaw relative imports. (with the memo, a chdir would only
+            # affect files first seen after it)
+            (os.path.abspath(self._file_path_prefix), os.path.abspath(os.path.normcase(filename)))
         ) == self._file_path_prefix
+        self._is_app_filename[filename] = is_app_filename
+        return is_app_filename
 
     def enabled_for_record(self, record):
         return record.levelno >= logging.WARNING or (has_request_context() and getattr(request, "is_sampled", False))
 
 
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # waiting for space if the queue is full, rather than raising queue.Full
+        self.queue.put(self._sentinel)
+
+
+class DMQueueHandler(logging.handlers.QueueHandler):
+    """
+        QueueHandler passing records to a background ``QueueListener`` thread which formats them and writes them to
+        ``handlers``, so logging threads don't have to wait for either. When the (bounded) queue is full, ``overflow``
+        decides what happens:
+
+        - ``"block"``: wait for space in the queue
+        - ``"drop-debug"``: drop records below INFO level, waiting for space for any others
+        - ``"drop-oldest"``: drop the oldest record in the queue to make space
+
+        Records dropped are counted by level name in ``dropped``. ``stop`` (called automatically at exit) waits for
+        everything queued to be written. A started handler gets a new queue and listener in forked children, where
+        ``os.register_at_fork`` is available.
+    """
+    def __init__(self, queue_, handlers, overflow=LOG_QUEUE_OVERFLOW_BLOCK):
+        if overflow not in LOG_QUEUE_OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown log queue overflow policy {overflow!r}")
+
+        super().__init__(queue_)
+        self.overflow = overflow
+        self.dropped = Counter()
+        self._dropped_lock = threading.Lock()
+        self._listener = _QueueListener(queue_, *handlers, respect_handler_level=True)
+
+    @property
+    def handlers(self):
+        return self._listener.handlers
+
+    def start(self):
+        self._listener.start()
+        _started_queue_handlers.add(self)
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Wait for the listener to write everything queued, then stop it"""
+        atexit.unregister(self.stop)
+        _started_queue_handlers.discard(self)
+        if self._listener._thread is None:
+            return
+
+        self._listener.stop()
+        if self.dropped:
+            # written directly, as there's no longer a listener to queue it for
+            self._listener.handle(logging.makeLogRecord({
+                "name": logger.name,
+                "levelno": logging.WARNING,
+                "levelname": logging.getLevelName(logging.WARNING),
+                "msg": "Dropped {dropped_log_records} log records from full log queue",
+                "dropped_log_records": dict(self.dropped),
+            }))
+
+    def prepare(self, record):
+        # unlike the default, we leave formatting to the listener - all we need to do is resolve any arguments to the
+        # message while they still have the values they were logged with
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def _drop(self, record):
+        with self._dropped_lock:
+            self.dropped[record.levelname] += 1
+
+    def enqueue(self, record):
+        if self._listener._thread is None:
+            # not started, or already stopped (e.g. logging from a later atexit function)
+            self._listener.handle(record)
+        elif threading.current_thread() is self._listener._thread:
+            # e.g. logged while formatting a record. if we waited for space, the listener would be waiting for itself
+            self._put_or_drop(record)
+        elif self.overflow == LOG_QUEUE_OVERFLOW_BLOCK or (
+            self.overflow == LOG_QUEUE_OVERFLOW_DROP_DEBUG and record.levelno >= logging.INFO
+        ):
+            self.queue.put(record)
+        elif self.overflow == LOG_QUEUE_OVERFLOW_DROP_DEBUG:
+            self._put_or_drop(record)
+        else:
+            while True:
+                try:
+                    self.queue.put_nowait(record)
+                    return
+                except queue.Full:
+                    if not self._drop_oldest():
+                        # the listener is stopping, so won't be reading anything queued after this point
+                        self._drop(record)
+                        return
+
+    def _put_or_drop(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop(record)
+
+    def _drop_oldest(self):
+        """Make space in the queue by dropping its oldest record, returning False if it's the listener's sentinel"""
+        try:
+            oldest_record = self.queue.get_nowait()
+        except queue.Empty:
+            # the listener has just made space
+            return True
+        self.queue.task_done()
+
+        if oldest_record is self._listener._sentinel:
+            # the listener is still draining the queue to reach this, so will make space for it
+            self.queue.put(oldest_record)
+            return False
+
+        self._drop(oldest_record)
+        return True
+
+    def _restart_after_fork(self):
+        # a forked child has no listener thread, and may have copied the queue's locks while another thread held them.
+        # anything already queued is the parent's to write, so the child starts again with an empty queue
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = Counter()
+        self._dropped_lock = threading.Lock()
+        self._listener = _QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self._listener.start()
+
+
+# started DMQueueHandlers, whose listeners need restarting in forked children
+_started_queue_handlers: "weakref.WeakSet[DMQueueHandler]" = weakref.WeakSet()
+
+
+def _restart_log_queues_after_fork():
+    for queue_handler in list(_started_queue_handlers):
+        queue_handler._restart_after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_log_queues_after_fork)
+
+
 class RequestExtraContextFilter(logging.Filter):
     """
         Filter which will pull extra context from the current request's `get_extra_log_context` method (if present)
@@ -236,7 +483,7 @@ class RequestExtraContextFilter(logging.Filter):
         return record
 
 
-class CustomLogFormatter(logging.Formatter):
+class CustomLogFormatter(FormatOncePerRecordMixin, logging.Formatter):
     """Accepts a format string for the message and formats it with the extra fields"""
 
     FORMAT_STRING_FIELDS_PATTERN = re.compile(r'\((.+?)\)')
@@ -248,9 +495,9 @@ class CustomLogFormatter(logging.Formatter):
             fetched_value = record.__dict__.get(field)
             record.__dict__[field] = fetched_value if fetched_value is not None else "-"
 
-    def format(self, record):
+    def format_record(self, record):
         self.add_fields(record)
-        msg = super(CustomLogFormatter, self).format(record)
+        msg = logging.Formatter.format(self, record)
 
         try:
             msg = msg.format(**record.__dict__)
@@ -271,7 +518,7 @@ class CustomLogFormatter(logging.Formatter):
         return msg
 
 
-class JSONFormatter(BaseJSONFormatter):
+class JSONFormatter(FormatOncePerRecordMixin, BaseJSONFormatter):
     def __init__(self, *args, max_missing_key_attempts=5, **kwargs):
         super().__init__(*args, **kwargs)
         self._max_missing_key_attempts = max_missing_key_attempts
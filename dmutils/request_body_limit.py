@@ -0,0 +1,167 @@
+"""
+Reject request bodies over a size limit while they are still being received, before Werkzeug buffers the whole body
+(e.g. a multipart document upload) into memory or a temporary file.
+
+Limits are looked up by endpoint, in order, from:
+
+- the ``DM_REQUEST_BODY_LIMITS`` config dict of endpoint name to maximum size in bytes
+- a ``limit_request_body`` decorator on the view
+- ``DM_REQUEST_BODY_LIMIT``, the default for all endpoints (and unroutable requests). ``None`` (the default) means
+  no limit.
+
+A request with a ``Content-Length`` over its limit is rejected with a 413 without reading any of its body. Otherwise
+the body is counted as it is read and a 413 raised as soon as it goes over the limit, so chunked requests and requests
+lying about their length are caught too.
+"""
+from flask import current_app, request
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from werkzeug.wsgi import get_content_length
+
+from .documents import DOCUMENT_SIZE_LIMIT
+
+
+# allowance for multipart boundaries and headers and for the form's other fields in a document upload
+DOCUMENT_UPLOAD_OVERHEAD = 64 * 1024
+
+_LIMIT_ENVIRON_KEY = "dmutils.request_body_limit"
+
+
+def document_upload_limit(documents=1):
+    """The request body size needed to upload ``documents`` documents of up to ``DOCUMENT_SIZE_LIMIT`` in one form"""
+    return documents * DOCUMENT_SIZE_LIMIT + DOCUMENT_UPLOAD_OVERHEAD
+
+
+def limit_request_body(max_bytes):
+    """
+    Decorator setting the maximum request body size in bytes a view accepts, overriding ``DM_REQUEST_BODY_LIMIT``.
+    Must be applied beneath the ``route`` decorator.
+    """
+    def decorator(view):
+        view._dm_request_body_limit = max_bytes
+        return view
+    return decorator
+
+
+def _reject(limit, received=None):
+    current_app.logger.warning(
+        "Rejecting request body larger than {request_body_limit} bytes",
+        extra={
+            "request_body_limit": limit,
+            "request_body_received": received,
+            "content_length": request.content_length,
+        },
+    )
+    raise RequestEntityTooLarge()
+
+
+class LimitedInputStream(object):
+    """
+    Wraps a WSGI input stream, never reading more than one byte past ``limit`` from it and raising
+    ``RequestEntityTooLarge`` once that byte has been read, or on the first read if ``content_length`` is already
+    over the limit
+    """
+    def __init__(self, stream, limit, content_length=None):
+        self._stream = stream
+        self.limit = limit
+        self.content_length = content_length
+        self.received = 0
+
+    def _read_size(self, size):
+        if self.content_length is not None and self.content_length > self.limit:
+            _reject(self.limit)
+
+        remaining = self.limit + 1 - self.received
+        if size is None or size < 0:
+            return remaining
+        return min(size, remaining)
+
+    def _count(self, data):
+        self.received += len(data)
+        if self.received > self.limit:
+            _reject(self.limit, self.received)
+        return data
+
+    def read(self, size=-1):
+        return self._count(self._stream.read(self._read_size(size)))
+
+    def readline(self, size=-1):
+        return self._count(self._stream.readline(self._read_size(size)))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration()
+        return line
+
+
+class RequestBodyLimit(object):
+    def __init__(self, wsgi_app, app):
+        self.wsgi_app = wsgi_app
+        self.app = app
+        self._view_count = None
+        self._has_view_limits = False
+
+    def _limits_configured(self):
+        """Whether any limit could apply to a request, so apps without any needn't pay for matching its endpoint"""
+        config = self.app.config
+        if config.get("DM_REQUEST_BODY_LIMIT") is not None or config.get("DM_REQUEST_BODY_LIMITS"):
+            return True
+
+        # flask won't let an endpoint's view be replaced, so new views (possibly with limits) mean a new count
+        view_count = len(self.app.view_functions)
+        if view_count != self._view_count:
+            self._has_view_limits = any(
+                hasattr(view, "_dm_request_body_limit") for view in self.app.view_functions.values()
+            )
+            self._view_count = view_count
+        return self._has_view_limits
+
+    def _get_endpoint(self, environ):
+        adapter = self.app.url_map.bind_to_environ(environ, server_name=self.app.config.get("SERVER_NAME"))
+        try:
+            endpoint, _ = adapter.match()
+        except HTTPException:
+            # flask will respond to these itself (including with redirects), so only the default limit applies
+            return None
+        return endpoint
+
+    def get_limit(self, environ):
+        endpoint = self._get_endpoint(environ)
+        endpoint_limits = self.app.config.get("DM_REQUEST_BODY_LIMITS") or {}
+        if endpoint in endpoint_limits:
+            return endpoint_limits[endpoint]
+
+        view = self.app.view_functions.get(endpoint)
+        if hasattr(view, "_dm_request_body_limit"):
+            return view._dm_request_body_limit
+
+        return self.app.config.get("DM_REQUEST_BODY_LIMIT")
+
+    def __call__(self, environ, start_response):
+        # requests without either header have no body to limit
+        if (environ.get("CONTENT_LENGTH") or environ.get("HTTP_TRANSFER_ENCODING")) and self._limits_configured():
+            limit = self.get_limit(environ)
+            if limit is not None:
+                environ[_LIMIT_ENVIRON_KEY] = limit
+                environ["wsgi.input"] = LimitedInputStream(
+                    environ["wsgi.input"], limit, content_length=get_content_length(environ),
+                )
+
+        return self.wsgi_app(environ, start_response)
+
+
+def init_app(app):
+    app.config.setdefault("DM_REQUEST_BODY_LIMIT", None)
+    app.config.setdefault("DM_REQUEST_BODY_LIMITS", {})
+
+    app.wsgi_app = RequestBodyLimit(app.wsgi_app, app)
+
+    @app.before_request
+    def reject_declared_oversize_request_body():
+        # the input stream would reject these too, but only if something reads it
+        limit = request.environ.get(_LIMIT_ENVIRON_KEY)
+        if limit is not None and (request.content_length or 0) > limit:
+            _reject(limit)
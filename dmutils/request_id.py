@@ -12,6 +12,8 @@ class RequestIdRequestMixin(object):
     # a single class-wide random instance should be good enough for now
     _spanid_random = _traceid_random = SystemRandom()
 
+    _extra_log_context = None
+
     @property
     def request_id(self):
         return self.trace_id
@@ -28,6 +30,11 @@ class RequestIdRequestMixin(object):
             ) or self._get_new_trace_id()
         return self._trace_id
 
+    @trace_id.setter
+    def trace_id(self, value):
+        self._trace_id = value
+        self.invalidate_extra_log_context()
+
     @property
     def span_id(self):
         """
@@ -41,6 +48,11 @@ class RequestIdRequestMixin(object):
             self._span_id = self._get_first_header(current_app.config['DM_SPAN_ID_HEADERS'])
         return self._span_id
 
+    @span_id.setter
+    def span_id(self, value):
+        self._span_id = value
+        self.invalidate_extra_log_context()
+
     @property
     def parent_span_id(self):
         """
@@ -50,6 +62,11 @@ class RequestIdRequestMixin(object):
             self._parent_span_id = self._get_first_header(current_app.config['DM_PARENT_SPAN_ID_HEADERS'])
         return self._parent_span_id
 
+    @parent_span_id.setter
+    def parent_span_id(self, value):
+        self._parent_span_id = value
+        self.invalidate_extra_log_context()
+
     @property
     def is_sampled(self):
         if not hasattr(self, "_is_sampled"):
@@ -57,6 +74,11 @@ class RequestIdRequestMixin(object):
             self._is_sampled = self.debug_flag or (None if header_value is None else header_value == "1")
         return self._is_sampled
 
+    @is_sampled.setter
+    def is_sampled(self, value):
+        self._is_sampled = value
+        self.invalidate_extra_log_context()
+
     @property
     def debug_flag(self):
         if not hasattr(self, "_debug_flag"):
@@ -64,6 +86,11 @@ class RequestIdRequestMixin(object):
             self._debug_flag = None if header_value is None else header_value == "1"
         return self._debug_flag
 
+    @debug_flag.setter
+    def debug_flag(self, value):
+        self._debug_flag = value
+        self.invalidate_extra_log_context()
+
     def _get_first_header(self, header_names):
         """
         Returns value of request's first present (and Truthy) header from header_names
@@ -114,16 +141,23 @@ class RequestIdRequestMixin(object):
 
     def get_extra_log_context(self):
         """
-            extra attributes to be made available on a log record based on this request
+            extra attributes to be made available on a log record based on this request. this is called for every
+            record logged during the request, so is computed once and reused until one of the trace properties it's
+            built from is set (or ``invalidate_extra_log_context`` called) - callers shouldn't modify the returned dict
         """
-        return {
-            "trace_id": self.trace_id,
-            "span_id": self.span_id,
-            "parent_span_id": self.parent_span_id,
-            # output these as 1|0 strings to match what's easily outputtable by nginx
-            "is_sampled": "1" if self.is_sampled else "0",
-            "debug_flag": "1" if self.debug_flag else "0",
-        }
+        if self._extra_log_context is None:
+            self._extra_log_context = {
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_span_id": self.parent_span_id,
+                # output these as 1|0 strings to match what's easily outputtable by nginx
+                "is_sampled": "1" if self.is_sampled else "0",
+                "debug_flag": "1" if self.debug_flag else "0",
+            }
+        return self._extra_log_context
+
+    def invalidate_extra_log_context(self):
+        self._extra_log_context = None
 
 
 class ResponseHeaderMiddleware(object):
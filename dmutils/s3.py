@@ -1,36 +1,505 @@
 from __future__ import absolute_import
 
-import subprocess
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 import datetime
+import hashlib
 from dateutil.parser import parse as parse_time
 import logging
 import mimetypes
 import os
+import threading
+import time
+from typing import Any, Dict, Tuple
 
 import flask
 
 # a bit of a lie here - retains compatibility with consumers that were importing boto2's S3ResponseError from here. this
 # is the exception boto3 raises in (mostly) the same situations.
 from botocore.exceptions import ClientError as S3ResponseError
+from botocore.config import Config
+from boto3.s3.transfer import TransferConfig
 
 from .formats import DATETIME_FORMAT
+from .s3_metrics import enable_s3_metrics, record_s3_request, register_s3_metrics_handlers, s3_metrics_enabled
 from .timing import logged_duration_for_external_request as log_external_request
 
 logger = logging.getLogger(__name__)
 
 FILE_SIZE_LIMIT = 5400000  # approximately 5Mb
 
+# default size of the chunks yielded when streaming an object's contents
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# object metadata field in which we store a hex SHA-256 digest of an object's contents, if requested
+DIGEST_METADATA_KEY = "sha256"
+# maximum number of keys S3 will accept in a single DeleteObjects request
+DELETE_OBJECTS_BATCH_SIZE = 1000
+# maximum (and default) number of keys S3 will return in a single ListObjectsV2 page
+LIST_OBJECTS_PAGE_SIZE = 1000
+# number of other keys per target copy_many's existence check may list between its first and last targets before
+# it gives up on a single listing and lists the rest of the targets' "directories" one at a time
+EXISTENCE_CHECK_KEYS_PER_PATH = 20
+# default size of each ranged GET when streaming an object's contents using parallel requests
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+
 default_region = "eu-west-1"
 
+# error codes with which a HEAD/GET request reports that an object doesn't exist, as opposed to some other failure
+NOT_FOUND_ERROR_CODES = frozenset(("404", "NoSuchKey", "NotFound"))
+
+# mapping of app config keys to the botocore Config options they control
+BOTOCORE_CONFIG_OPTIONS = (
+    ("DM_S3_MAX_POOL_CONNECTIONS", "max_pool_connections"),
+    ("DM_S3_TCP_KEEPALIVE", "tcp_keepalive"),
+    ("DM_S3_CONNECT_TIMEOUT", "connect_timeout"),
+    ("DM_S3_READ_TIMEOUT", "read_timeout"),
+)
+
+# mapping of app config keys to the botocore retry options they control, e.g. DM_S3_RETRY_MODE of "standard" or
+# "adaptive"
+BOTOCORE_RETRY_OPTIONS = (
+    ("DM_S3_RETRY_MODE", "mode"),
+    ("DM_S3_MAX_ATTEMPTS", "max_attempts"),
+)
+
+# mapping of app config keys to the boto3 TransferConfig options they control. multipart uploads are only used if
+# DM_S3_MULTIPART_THRESHOLD is set.
+TRANSFER_CONFIG_OPTIONS = (
+    ("DM_S3_MULTIPART_THRESHOLD", "multipart_threshold"),
+    ("DM_S3_MULTIPART_CHUNKSIZE", "multipart_chunksize"),
+    ("DM_S3_MULTIPART_MAX_CONCURRENCY", "max_concurrency"),
+)
+
+# shared boto3 resources and clients, by the arguments they were created with
+_resource_cache: Dict[Tuple, Any] = {}
+_resource_cache_lock = threading.Lock()
+
+
+def _get_botocore_config_options(app):
+    config_options = tuple(
+        (option_name, app.config[config_key])
+        for config_key, option_name in BOTOCORE_CONFIG_OPTIONS
+        if app.config.get(config_key) is not None
+    )
+    retry_options = tuple(
+        (option_name, app.config[config_key])
+        for config_key, option_name in BOTOCORE_RETRY_OPTIONS
+        if app.config.get(config_key) is not None
+    )
+    if retry_options:
+        # kept as a tuple of pairs rather than a dict so config_options remains usable as a cache key
+        config_options += (("retries", retry_options),)
+
+    return config_options
+
+
+def _get_transfer_config(app):
+    if app.config.get("DM_S3_MULTIPART_THRESHOLD") is None:
+        return None
+    return TransferConfig(**{
+        option_name: app.config[config_key]
+        for config_key, option_name in TRANSFER_CONFIG_OPTIONS
+        if app.config.get(config_key) is not None
+    })
+
+
+def get_resource(region_name=default_region, config_options=(), **kwargs):
+    """
+    Return a boto3 s3 resource for these arguments, shared with any other callers in this process asking for the same
+    thing. Creating a resource involves a new session, a credentials lookup and a fresh connection pool, so sharing
+    them lets repeated ``S3()`` instantiations (e.g. once per request) reuse warm connections.
+
+    Sharing a resource between threads is safe as we use it: boto3 resources are only unsafe to share because of the
+    attributes they load and cache, and the service resource and ``Bucket``s we share are never loaded - they only
+    hand out new ``Object``/``ObjectSummary`` instances for each call, which stay within the calling thread, and make
+    requests through their client, which is thread-safe. Any new code sharing a loaded resource (e.g. an ``Object``)
+    between threads would have to talk to the client directly instead.
+
+    :param region_name:    AWS region
+    :param config_options: tuple of ``(name, value)`` pairs to construct a ``botocore.config.Config`` from. the value
+                           for ``retries`` is itself a tuple of ``(name, value)`` pairs
+    :param kwargs:         further arguments for ``boto3.resource``
+    """
+    try:
+        cache_key = (region_name, config_options, tuple(sorted(kwargs.items())))
+        hash(cache_key)
+    except TypeError:
+        # unhashable arguments - we can't safely share this resource
+        cache_key = None
+
+    with _resource_cache_lock:
+        # creation is performed under the lock too as boto3's default session setup isn't thread-safe
+        if cache_key is None or cache_key not in _resource_cache:
+            if config_options and "config" not in kwargs:
+                kwargs["config"] = Config(**{
+                    name: dict(value) if name == "retries" else value
+                    for name, value in config_options
+                })
+            resource = boto3.resource("s3", region_name=region_name, **kwargs)
+            if s3_metrics_enabled():
+                register_s3_metrics_handlers(resource.meta.client)
+            _register_circuit_breaker_handlers(resource.meta.client)
+            if cache_key is None:
+                return resource
+            _resource_cache[cache_key] = resource
+
+        return _resource_cache[cache_key]
+
+
+def get_regional_presigning_client(region_name=default_region):
+    """
+    Return a (shared) boto3 s3 client which produces presigned URLs in the same form as ``aws s3 presign``, i.e. SigV4
+    signed, virtual-host-addressed and using the regional endpoint (``https://<bucket>.s3.<region>.amazonaws.com``).
+    """
+    cache_key = ("regional-presigning-client", region_name)
+    with _resource_cache_lock:
+        if cache_key not in _resource_cache:
+            _resource_cache[cache_key] = boto3.client(
+                "s3",
+                region_name=region_name,
+                endpoint_url=f"https://s3.{region_name}.amazonaws.com",
+                config=Config(signature_version="s3v4", s3={"addressing_style": "virtual"}),
+            )
+
+        return _resource_cache[cache_key]
+
+
+def reset_resource_cache():
+    """
+    Discard all shared boto3 resources and clients. Connection pools must not be shared across a fork, so pre-fork
+    servers should ensure this is called in each worker after forking. This happens automatically where
+    ``os.register_at_fork`` is available.
+    """
+    with _resource_cache_lock:
+        _resource_cache.clear()
+
+
+def _reset_resource_cache_after_fork():
+    # the lock may have been held by another thread at the moment of forking, so we can't rely on acquiring it here
+    global _resource_cache_lock
+    _resource_cache_lock = threading.Lock()
+    _resource_cache.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_resource_cache_after_fork)
+
+
+class _ExpiringLRUCache(object):
+    """
+    Bounded, thread-safe LRU mapping whose entries each carry an expiry time
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get(self, key, safety_margin=0):
+        """Return a tuple of (found, value), ignoring (and dropping) entries expiring within ``safety_margin``"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if time.monotonic() + safety_margin < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+
+            self.misses += 1
+            return False, None
+
+    def _set(self, key, value, expires_in):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + expires_in)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SignedURLCache(_ExpiringLRUCache):
+    """
+    A bounded, thread-safe LRU cache of presigned URLs, allowing a URL to be handed out repeatedly while it still has
+    a useful amount of validity left rather than performing a HEAD request and re-signing on every call.
+
+    Entries are keyed by ``(bucket_name, path, expires_in, base_url)``.
+    """
+    def __init__(self, maxsize=1024, safety_margin=10):
+        """
+        :param maxsize:       maximum number of URLs to hold, least recently used entries being evicted first
+        :param safety_margin: minimum number of seconds of validity a cached URL must have remaining to be reused
+        """
+        super().__init__(maxsize)
+        self.safety_margin = safety_margin
+
+    def get(self, key):
+        """Return the cached URL for ``key`` if there is one with enough validity left, otherwise ``None``"""
+        return self._get(key, safety_margin=self.safety_margin)[1]
+
+    def set(self, key, url, expires_in):
+        """Store ``url``, signed just now to be valid for ``expires_in`` seconds, under ``key``"""
+        self._set(key, url, expires_in)
+
+
+class S3CircuitBreakerOpenError(S3ResponseError):
+    """
+    Raised instead of making a request to a bucket whose circuit breaker is open. Being a ``ClientError`` (a.k.a.
+    ``S3ResponseError``), existing error handling around S3 calls deals with it as it would a failed request.
+    """
+    def __init__(self, bucket_name, operation_name):
+        super().__init__(
+            {
+                "Error": {
+                    "Code": "CircuitBreakerOpen",
+                    "Message": f"Not calling S3 for bucket {bucket_name}: too many recent failures",
+                },
+                "ResponseMetadata": {"HTTPStatusCode": 503},
+            },
+            operation_name,
+        )
+
+
+class S3CircuitBreaker(object):
+    """
+    Thread-safe circuit breaker for requests to a single bucket. After ``failure_threshold`` consecutive failures
+    (connection errors, timeouts or 5xx responses) it opens, failing requests immediately rather than tying up request
+    threads waiting on a struggling S3. Once ``reset_timeout`` seconds have passed a single probe request is let
+    through (half-open): success closes the breaker again, failure re-opens it.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, bucket_name, failure_threshold=5, reset_timeout=30):
+        self.bucket_name = bucket_name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return whether a request may be made now, starting a probe if it's time for one"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_started_at = now
+                return True
+            if self.state == self.HALF_OPEN and now - self._probe_started_at >= self.reset_timeout:
+                # the last probe never reported back, so try another
+                self._probe_started_at = now
+                return True
+
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Closing S3 circuit breaker for {bucket}", extra={"bucket": self.bucket_name})
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                logger.warning(
+                    "Opening S3 circuit breaker for {bucket} after {failures} consecutive failures",
+                    extra={"bucket": self.bucket_name, "failures": self.consecutive_failures},
+                )
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+# process-wide registry of circuit breakers, by bucket name
+_circuit_breakers: Dict[str, "S3CircuitBreaker"] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def configure_circuit_breaker(bucket_name, failure_threshold=5, reset_timeout=30):
+    """
+    Enable a circuit breaker for requests to ``bucket_name`` made through clients from ``get_resource``, or update
+    the settings of the existing one, returning it. Breakers are shared process-wide so all request threads see the
+    same state.
+    """
+    with _circuit_breakers_lock:
+        breaker = _circuit_breakers.get(bucket_name)
+        if breaker is None:
+            breaker = _circuit_breakers[bucket_name] = S3CircuitBreaker(bucket_name, failure_threshold, reset_timeout)
+        else:
+            breaker.failure_threshold = failure_threshold
+            breaker.reset_timeout = reset_timeout
+        return breaker
+
+
+def reset_circuit_breakers():
+    """Discard all circuit breakers"""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
+
+
+def _circuit_breaker_before_parameter_build(params, model, context, **kwargs):
+    if context.get("is_presign_request"):
+        return
+
+    breaker = _circuit_breakers.get(params.get("Bucket"))
+    if breaker is None:
+        return
+    if not breaker.allow_request():
+        raise S3CircuitBreakerOpenError(breaker.bucket_name, model.name)
+    context["dm_s3_circuit_breaker"] = breaker
+
+
+def _circuit_breaker_after_call(http_response, context, **kwargs):
+    breaker = context.pop("dm_s3_circuit_breaker", None)
+    if breaker is not None:
+        if http_response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+
+def _circuit_breaker_after_call_error(context, **kwargs):
+    breaker = context.pop("dm_s3_circuit_breaker", None)
+    if breaker is not None:
+        breaker.record_failure()
+
+
+def _register_circuit_breaker_handlers(client):
+    events = client.meta.events
+    events.register(
+        "before-parameter-build.s3", _circuit_breaker_before_parameter_build, unique_id="dm-s3-circuit-breaker-check",
+    )
+    events.register("after-call.s3", _circuit_breaker_after_call, unique_id="dm-s3-circuit-breaker-after-call")
+    events.register(
+        "after-call-error.s3", _circuit_breaker_after_call_error, unique_id="dm-s3-circuit-breaker-after-call-error",
+    )
+
+
+class S3MetadataCache(object):
+    """
+    Interface for caches of S3 object metadata (i.e. the results of HEAD requests) which can be passed to ``S3()``.
+    Keys are ``(bucket_name, path)`` tuples and values either a loaded boto3 ``Object`` or ``None`` to record the
+    object as not existing.
+    """
+    def get(self, key):
+        """Return a tuple of (found, value)"""
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    def invalidate(self, key):
+        raise NotImplementedError
+
+
+class TTLS3MetadataCache(_ExpiringLRUCache, S3MetadataCache):
+    """
+    Process-wide S3 metadata cache, holding each result for at most ``ttl`` seconds
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key):
+        return self._get(key)
+
+    def set(self, key, value):
+        self._set(key, value, self.ttl)
+
+
+class RequestScopedS3MetadataCache(S3MetadataCache):
+    """
+    S3 metadata cache which only remembers results for the lifetime of the current flask app context (so usually
+    the current request). Outside an app context nothing is cached.
+    """
+    def _get_entries(self):
+        if not flask.has_app_context():
+            return None
+        if not hasattr(flask.g, "_dm_s3_metadata_cache"):
+            flask.g._dm_s3_metadata_cache = {}
+        return flask.g._dm_s3_metadata_cache
+
+    def get(self, key):
+        entries = self._get_entries()
+        if entries is None or key not in entries:
+            return False, None
+        return True, entries[key]
+
+    def set(self, key, value):
+        entries = self._get_entries()
+        if entries is not None:
+            entries[key] = value
+
+    def invalidate(self, key):
+        entries = self._get_entries()
+        if entries is not None:
+            entries.pop(key, None)
+
 
 class S3(object):
-    def __init__(self, bucket_name, region_name=default_region, **kwargs):
+    def __new__(cls, bucket_name, *args, **kwargs):
+        if cls is S3 and flask.current_app and flask.current_app.config.get("DM_S3_BACKEND") == "local":
+            # imported here as s3_local itself builds on this module
+            from .s3_local import LocalS3
+            return LocalS3(
+                bucket_name,
+                flask.current_app.config["DM_S3_LOCAL_ROOT"],
+                base_url=flask.current_app.config.get("DM_S3_LOCAL_BASE_URL"),
+            )
+
+        return super().__new__(cls)
+
+    def __init__(self, bucket_name, region_name=default_region, metadata_cache=None, transfer_config=None, **kwargs):
+        """
+        :param bucket_name:     name of the bucket this instance operates on
+        :param region_name:     AWS region
+        :param metadata_cache:  optional ``S3MetadataCache`` to remember the results of HEAD requests in
+        :param transfer_config: optional ``boto3.s3.transfer.TransferConfig``. if set, files of at least its
+                                ``multipart_threshold`` in size are saved using concurrent multipart uploads
+        :param kwargs:          further arguments for ``boto3.resource``
+        """
+        self._metadata_cache = metadata_cache
+        self._transfer_config = transfer_config
+        config_options = ()
         if flask.current_app:
             app = flask.current_app
             if app.env == "development" and app.config.get("DM_S3_ENDPOINT_URL"):
                 kwargs.setdefault("endpoint_url", app.config["DM_S3_ENDPOINT_URL"])
-        self._resource = boto3.resource("s3", region_name=region_name, **kwargs)
+            if app.config.get("DM_S3_METRICS"):
+                enable_s3_metrics()
+            config_options = _get_botocore_config_options(app)
+            if self._transfer_config is None:
+                self._transfer_config = _get_transfer_config(app)
+            if app.config.get("DM_S3_CIRCUIT_BREAKER_THRESHOLD"):
+                configure_circuit_breaker(
+                    bucket_name,
+                    failure_threshold=app.config["DM_S3_CIRCUIT_BREAKER_THRESHOLD"],
+                    reset_timeout=app.config.get("DM_S3_CIRCUIT_BREAKER_RESET_TIMEOUT", 30),
+                )
+        self._resource = get_resource(region_name=region_name, config_options=config_options, **kwargs)
         self._bucket = self._resource.Bucket(bucket_name)
 
     @property
@@ -38,7 +507,7 @@ class S3(object):
         return self._bucket.name
 
     def save(self, path, file_, acl='public-read', timestamp=None, download_filename=None,
-             disposition_type='attachment'):
+             disposition_type='attachment', store_digest=False, dedupe_prefix=None):
         """Save a file in an S3 bucket
 
         canned ACL list: https://docs.aws.amazon.com/AmazonS3/latest/dev/acl-overview.html#canned-acl
@@ -49,42 +518,140 @@ class S3(object):
         :param timestamp:         Timestamp to set for this file rather than using utcnow
         :param download_filename: Suggested name for a browser to download, part of Content-Disposition header
         :param disposition_type:  Content-Disposition type - e.g. "attachment" or "inline"
+        :param store_digest:      if True, store a SHA-256 digest of the file's contents in the object's metadata
+        :param dedupe_prefix:     if set, the "logical document" path prefix ``path`` is a version of (e.g. ``path``
+                                  without its timestamp suffix). if the newest object under this prefix with the same
+                                  file extension has a stored digest matching this file's, nothing is uploaded and the
+                                  existing object's key is returned instead. implies ``store_digest``.
 
         :return: S3 Key
         """
         path = self._normalize_path(path)
-        timestamp = timestamp or datetime.datetime.utcnow()
         filesize = get_file_size(file_)
 
         obj = self._bucket.Object(path)
-        extra_kwargs = {}
+        extra_kwargs = self._get_save_extra_args(acl, timestamp, download_filename, disposition_type)
+
+        if store_digest or dedupe_prefix is not None:
+            # this has to be a separate pass over the file before uploading it - object metadata is sent ahead of
+            # the body, and we need the digest to decide whether to upload at all
+            digest = get_file_digest(file_)
+            extra_kwargs["Metadata"][DIGEST_METADATA_KEY] = digest
+
+            if dedupe_prefix is not None:
+                existing_obj = self._get_newest_version_with_digest(dedupe_prefix, path, digest)
+                if existing_obj is not None:
+                    logger.info(
+                        "Skipping upload of {path}: contents unchanged from {existing_path}",
+                        extra={"path": path, "existing_path": existing_obj.key},
+                    )
+                    return self._format_key(existing_obj)
+
+        if self._transfer_config is not None and filesize >= self._transfer_config.multipart_threshold:
+            self._save_multipart(obj, file_, filesize, acl, extra_kwargs, self._transfer_config)
+        else:
+            log_description = 'file upload [{filepath} of size {filesize} and acl {fileacl}]'
+            with log_external_request('S3', log_description) as log_context:
+                log_context.update({
+                    "filepath": path,
+                    "filesize": filesize,
+                    "fileacl": acl,
+                })
+
+                obj.put(
+                    Body=file_,
+                    ContentType=self._get_mimetype(path),
+                    **extra_kwargs
+                )
+        self._invalidate_metadata(path)
+
+        return self._format_key(obj)
+
+    def save_stream(self, path, stream, acl='public-read', timestamp=None, download_filename=None,
+                    disposition_type='attachment'):
+        """Save the contents of a readable stream of unknown length, which needn't be seekable, in an S3 bucket
+
+        The stream is uploaded in parts (according to this instance's transfer config, or boto3's defaults) so only a
+        bounded amount of it is held in memory at a time. Arguments are otherwise as for ``save``.
+
+        :return: S3 Key
+        """
+        path = self._normalize_path(path)
+        obj = self._bucket.Object(path)
+        extra_args = self._get_save_extra_args(acl, timestamp, download_filename, disposition_type)
+
+        self._save_multipart(obj, stream, "unknown", acl, extra_args, self._transfer_config or TransferConfig())
+        self._invalidate_metadata(path)
+
+        return self._format_key(obj)
+
+    def _get_newest_version_with_digest(self, dedupe_prefix, path, digest):
+        """
+        Return the newest object under ``dedupe_prefix`` with the same extension as ``path``, if its stored digest
+        matches ``digest``, otherwise ``None``
+        """
+        ext = os.path.splitext(path)[1]
+        newest_entry = None
+        for page in self.iter_object_pages(dedupe_prefix):
+            for entry in page:
+                if os.path.splitext(entry["Key"])[1] == ext and (
+                    newest_entry is None
+                    or (entry["LastModified"], entry["Key"]) > (newest_entry["LastModified"], newest_entry["Key"])
+                ):
+                    newest_entry = entry
+
+        if newest_entry is None:
+            return None
+
+        newest_obj = self._get_key(newest_entry["Key"])
+        if newest_obj is None or newest_obj.metadata.get(DIGEST_METADATA_KEY) != digest:
+            return None
+
+        return newest_obj
+
+    def _get_save_extra_args(self, acl, timestamp, download_filename, disposition_type):
+        timestamp = timestamp or datetime.datetime.utcnow()
+        extra_args = {
+            "ACL": acl,
+            # using a custom "timestamp" field allows us to manually override it if necessary
+            "Metadata": {"timestamp": timestamp.strftime(DATETIME_FORMAT)},
+        }
         if download_filename:
-            extra_kwargs["ContentDisposition"] = u'{}; filename="{}"'.format(
-                disposition_type,
-                # boto/aws can't cope with unicode here, but wants the ultimate result as a `str` in py3, so doing this
-                # to strip non-ascii chars..
-                str(download_filename).encode("ascii", errors="ignore").decode(),
-            )
+            extra_args["ContentDisposition"] = get_content_disposition(download_filename, disposition_type)
+
+        return extra_args
+
+    def _save_multipart(self, obj, file_, filesize, acl, extra_args, transfer_config):
+        """
+        Upload ``file_`` to ``obj`` as a multipart upload with parts sent concurrently, according to
+        ``transfer_config``. On failure boto3 aborts the multipart upload so no orphaned parts are left behind.
+        """
+        extra_args = dict(extra_args)
+        content_type = self._get_mimetype(obj.key)
+        if content_type:
+            extra_args["ContentType"] = content_type
 
-        log_description = 'file upload [{filepath} of size {filesize} and acl {fileacl}]'
+        log_description = (
+            'multipart file upload [{filepath} of size {filesize} and acl {fileacl} in parts of {partsize} with '
+            'concurrency {concurrency}]'
+        )
         with log_external_request('S3', log_description) as log_context:
             log_context.update({
-                "filepath": path,
+                "filepath": obj.key,
                 "filesize": filesize,
                 "fileacl": acl,
+                "partsize": transfer_config.multipart_chunksize,
+                "concurrency": transfer_config.max_concurrency,
             })
 
-            obj.put(
-                ACL=acl,
-                Body=file_,
-                ContentType=self._get_mimetype(path),
-                # using a custom "timestamp" field allows us to manually override it if necessary
-                Metadata={"timestamp": timestamp.strftime(DATETIME_FORMAT)},
-                **extra_kwargs
+            self._resource.meta.client.upload_fileobj(
+                file_,
+                self.bucket_name,
+                obj.key,
+                ExtraArgs=extra_args,
+                Config=transfer_config,
             )
 
-        return self._format_key(obj)
-
     def copy(self, src_bucket, src_key, target_key, acl=None):
         """
         Copy an object that already exists in S3 to a new key in this S3 instance's bucket. The copy will be private by
@@ -100,6 +667,100 @@ class S3(object):
         if self.path_exists(target_key):
             raise ValueError('Target key already exists in S3.')
 
+        self._copy_object(src_bucket, src_key, target_key, acl)
+
+        return self._format_key(self._bucket.Object(target_key))
+
+    def copy_many(self, items, max_workers=4):
+        """
+        Copy many objects that already exist in S3 to new keys in this S3 instance's bucket, concurrently. As with
+        ``copy``, targets that already exist are not overwritten, but rather than a HEAD request per target their
+        existence is checked with a listing (see ``_get_existing_keys``).
+
+        :param items:       iterable of ``(src_bucket, src_key, target_key, acl)`` tuples, arguments as for ``copy``
+        :param max_workers: maximum number of copies to perform at once
+
+        :return: list of dicts, one for each item in the same order, containing the item's ``src_bucket``,
+                 ``src_key`` and ``target_key`` along with a ``status`` of ``"copied"``, ``"target_exists"`` or
+                 ``"failed"``, and for failures an ``error`` dict of the ``code`` and ``message`` S3 gave
+        """
+        items = [
+            (src_bucket, src_key, self._normalize_path(target_key), acl)
+            for src_bucket, src_key, target_key, acl in items
+        ]
+        existing_keys = self._get_existing_keys(target_key for _, _, target_key, _ in items)
+
+        results = []
+        to_copy = []
+        for src_bucket, src_key, target_key, acl in items:
+            result = {"src_bucket": src_bucket, "src_key": src_key, "target_key": target_key}
+            if target_key in existing_keys:
+                result["status"] = "target_exists"
+            else:
+                # later items with the same target shouldn't overwrite this one either
+                existing_keys.add(target_key)
+                to_copy.append((result, (src_bucket, src_key, target_key, acl)))
+            results.append(result)
+
+        def _copy(result_and_item):
+            result, item = result_and_item
+            try:
+                self._copy_object(*item)
+            except S3ResponseError as e:
+                result["status"] = "failed"
+                result["error"] = {"code": e.response.get("Error", {}).get("Code"), "message": str(e)}
+            else:
+                result["status"] = "copied"
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # consume the iterator so exceptions other than S3ResponseError are propagated
+            list(executor.map(_copy, to_copy))
+
+        return results
+
+    def _get_existing_keys(self, paths):
+        """
+        Return the subset of ``paths`` which exist. The keys from the first to the last of ``paths`` under their longest
+        common prefix are listed in one go, so targets spread across many "directories" (e.g. one per supplier) cost
+        a single listing. If that range turns out to hold too many other keys, the rest of ``paths`` are checked with
+        one listing per distinct "directory" instead.
+        """
+        paths = set(paths)
+        if not paths:
+            return set()
+
+        first_path, last_path = min(paths), max(paths)
+        max_scanned_keys = max(LIST_OBJECTS_PAGE_SIZE, EXISTENCE_CHECK_KEYS_PER_PATH * len(paths))
+
+        existing_keys = set()
+        scanned_keys = 0
+        # (S3 lists keys in the same order python sorts them)
+        for page in self.iter_object_pages(
+            os.path.commonprefix([first_path, last_path]),
+            # the nearest we can get to "starting at" first_path
+            start_after=first_path[:-1],
+            page_size=LIST_OBJECTS_PAGE_SIZE,
+        ):
+            existing_keys.update(entry["Key"] for entry in page if entry["Key"] in paths)
+            if not page or page[-1]["Key"] >= last_path:
+                return existing_keys
+
+            scanned_keys += len(page)
+            if scanned_keys >= max_scanned_keys:
+                checked_up_to = page[-1]["Key"]
+                break
+        else:
+            return existing_keys
+
+        remaining_paths = {path for path in paths if path > checked_up_to}
+        prefixes = {path.rpartition("/")[0] + "/" if "/" in path else "" for path in remaining_paths}
+        for prefix in sorted(prefixes):
+            for page in self.iter_object_pages(prefix, delimiter="/"):
+                existing_keys.update(entry["Key"] for entry in page if entry["Key"] in remaining_paths)
+
+        return existing_keys
+
+    def _copy_object(self, src_bucket, src_key, target_key, acl=None):
         extra_args = {'ACL': acl} if acl else {}
 
         log_description = 'copy document [{src_bucket}/{src_key} to {target_bucket}/{target_key}{set_acl}]'
@@ -112,9 +773,16 @@ class S3(object):
                 "set_acl": f" with '{acl} ACL" if acl else ""
             })
 
-            self._bucket.copy(CopySource={"Bucket": src_bucket, "Key": src_key}, Key=target_key, ExtraArgs=extra_args)
-
-        return self._format_key(self._bucket.Object(target_key))
+            try:
+                # the (thread-safe) client's managed copy, so this can be used from copy_many's workers
+                self._resource.meta.client.copy(
+                    CopySource={"Bucket": src_bucket, "Key": src_key},
+                    Bucket=self.bucket_name,
+                    Key=target_key,
+                    ExtraArgs=extra_args,
+                )
+            finally:
+                self._invalidate_metadata(target_key)
 
     @staticmethod
     def _normalize_path(path):
@@ -137,43 +805,51 @@ class S3(object):
         path = self._normalize_path(path)
         if self.path_exists(path):
             # Because we are using cloudfront as a load balancer for the assets
-            # the URL we generate needs to include the region.
-            # However boto3 does not do this so we are having to make use of
-            # the AWS CLI to create this URL.
+            # the URL we generate needs to include the region, which boto3's
+            # default client configuration doesn't do.
             if os.getenv("DM_ENVIRONMENT", None) == "native-aws":
-                result = subprocess.run(
-                    [
-                        'aws',
-                        's3',
-                        'presign',
-                        f's3://{self._bucket.name}/{path}',
-                        '--expires-in',
-                        str(expires_in)
-                    ],
-                    stdout=subprocess.PIPE,
-                    check=True,
-                )
-
-                return result.stdout.decode()
+                client = get_regional_presigning_client(self._resource.meta.client.meta.region_name)
             else:
-                return self._resource.meta.client.generate_presigned_url(
-                    "get_object",
-                    Params={
-                        "Bucket": self._bucket.name,
-                        "Key": path,
-                    },
-                    ExpiresIn=expires_in,
-                )
+                client = self._resource.meta.client
+
+            # presigning happens locally, outside botocore's request cycle, so isn't recorded automatically
+            start_time = time.perf_counter()
+            url = client.generate_presigned_url(
+                "get_object",
+                Params={
+                    "Bucket": self._bucket.name,
+                    "Key": path,
+                },
+                ExpiresIn=expires_in,
+            )
+            record_s3_request("Presign", self._bucket.name, "200", time.perf_counter() - start_time)
+
+            return url
 
     def _get_key(self, path):
         path = self._normalize_path(path)
+        cache_key = (self.bucket_name, path)
+        if self._metadata_cache is not None:
+            found, obj = self._metadata_cache.get(cache_key)
+            if found:
+                return obj
+
         try:
             obj = self._bucket.Object(path)
             obj.load()
-        except S3ResponseError:
+        except S3ResponseError as e:
+            if self._metadata_cache is not None and e.response.get("Error", {}).get("Code") in NOT_FOUND_ERROR_CODES:
+                self._metadata_cache.set(cache_key, None)
             return None
+
+        if self._metadata_cache is not None:
+            self._metadata_cache.set(cache_key, obj)
         return obj
 
+    def _invalidate_metadata(self, path):
+        if self._metadata_cache is not None:
+            self._metadata_cache.invalidate((self.bucket_name, self._normalize_path(path)))
+
     def get_key(self, path):
         path = self._normalize_path(path)
         obj = self._get_key(path)
@@ -181,33 +857,405 @@ class S3(object):
 
     def delete_key(self, path):
         path = self._normalize_path(path)
-        self._bucket.Object(path).delete()
+        try:
+            self._bucket.Object(path).delete()
+        finally:
+            self._invalidate_metadata(path)
 
-    def list(self, prefix='', delimiter='', load_timestamps=False):
+    def delete_keys(self, paths, max_workers=None):
+        """
+        Delete many objects, using as few DeleteObjects requests as possible
+
+        :param paths:       iterable of S3 object paths within the bucket
+        :param max_workers: if set, batches are sent concurrently from a pool of at most this many threads
+
+        :return: dict with keys ``deleted``, a list of the paths deleted, and ``errors``, a dict mapping each path
+                 that couldn't be deleted to a dict of the ``code`` and ``message`` S3 gave for it
+        """
+        paths = list(OrderedDict.fromkeys(self._normalize_path(path) for path in paths))
+        batches = [
+            paths[offset:offset + DELETE_OBJECTS_BATCH_SIZE]
+            for offset in range(0, len(paths), DELETE_OBJECTS_BATCH_SIZE)
+        ]
+
+        if max_workers and len(batches) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                batch_errors = list(executor.map(self._delete_batch, batches))
+        else:
+            batch_errors = [self._delete_batch(batch) for batch in batches]
+
+        errors = {path: error for errors_ in batch_errors for path, error in errors_.items()}
+        for path in paths:
+            self._invalidate_metadata(path)
+
+        return {
+            "deleted": [path for path in paths if path not in errors],
+            "errors": errors,
+        }
+
+    def _delete_batch(self, paths):
+        """
+        :return: dict of errors, keyed by path
+        """
+        log_description = 'delete objects [{key_count} keys with {error_count} errors{failed_keys}]'
+        try:
+            with log_external_request('S3', log_description) as log_context:
+                log_context.update({
+                    "key_count": len(paths),
+                    "error_count": 0,
+                    "failed_keys": "",
+                })
+
+                response = self._resource.meta.client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": path} for path in paths], "Quiet": True},
+                )
+
+                errors = {
+                    error["Key"]: {"code": error.get("Code"), "message": error.get("Message")}
+                    for error in response.get("Errors", ())
+                }
+                if errors:
+                    log_context.update({
+                        "error_count": len(errors),
+                        "failed_keys": ": " + ", ".join(errors.keys()),
+                    })
+
+                return errors
+        except S3ResponseError as e:
+            # the whole batch failed
+            error = {"code": e.response.get("Error", {}).get("Code"), "message": str(e)}
+            return {path: error for path in paths}
+
+    def delete_prefix(self, prefix, max_workers=None):
+        """
+        Delete all objects whose paths begin with ``prefix``
+
+        :param prefix:      must be non-empty - this is not a way to empty a bucket
+        :param max_workers: as for ``delete_keys``
+
+        :return: as for ``delete_keys``
+        """
+        prefix = self._normalize_path(prefix)
+        if not prefix:
+            raise ValueError("Refusing to delete objects under an empty prefix")
+
+        with log_external_request('S3', f'list objects [prefix={prefix}, delimiter=]'):
+            paths = [obj_s.key for obj_s in self._bucket.objects.filter(Prefix=prefix)]
+
+        return self.delete_keys(paths, max_workers=max_workers)
+
+    def iter_chunks(self, path, chunk_size=DEFAULT_CHUNK_SIZE, byte_range=None, max_workers=None,
+                    part_size=DEFAULT_PART_SIZE):
+        """
+        Stream the contents of an object, without holding more than a bounded amount of it in memory.
+
+        The request(s) are started before this returns, so a missing object will raise immediately rather than when
+        the returned iterator is first consumed.
+
+        :param path:       S3 object path within the bucket
+        :param chunk_size: maximum size in bytes of each chunk yielded
+        :param byte_range: optional tuple of ``(start, end)`` byte offsets to limit the content to. as with http range
+                           requests, ``end`` is inclusive and may be ``None`` to stream to the end of the object
+        :param max_workers: if set, the object is fetched using concurrent ranged GETs of ``part_size`` bytes each,
+                            at most ``max_workers`` being in flight (and held in memory) at a time
+        :param part_size:  size in bytes of each ranged GET when ``max_workers`` is set
+
+        :return: iterator of ``bytes``
+        :raises: botocore.exceptions.ClientError if the object doesn't exist
+        """
+        return self._open_stream(path, chunk_size, byte_range, max_workers, part_size)[1]
+
+    def streaming_response(self, path, chunk_size=DEFAULT_CHUNK_SIZE, byte_range=None, max_workers=None,
+                           part_size=DEFAULT_PART_SIZE, download_filename=None, disposition_type="attachment"):
+        """
+        Return a flask ``Response`` streaming the contents of an object to the client in constant memory. Arguments
+        are as for ``iter_chunks``, plus:
+
+        :param download_filename: Suggested name for a browser to download, part of Content-Disposition header
+        :param disposition_type:  Content-Disposition type - e.g. "attachment" or "inline"
+
+        :return: flask.Response, with a 206 status if a ``byte_range`` was requested
+        :raises: botocore.exceptions.ClientError if the object doesn't exist
+        """
+        stream_info, chunks = self._open_stream(path, chunk_size, byte_range, max_workers, part_size)
+
+        headers = {"Content-Length": str(stream_info["content_length"])}
+        if stream_info["content_range"]:
+            headers["Content-Range"] = stream_info["content_range"]
+        if download_filename:
+            headers["Content-Disposition"] = get_content_disposition(download_filename, disposition_type)
+
+        return flask.Response(
+            chunks,
+            status=206 if byte_range else 200,
+            headers=headers,
+            content_type=stream_info["content_type"] or "application/octet-stream",
+            direct_passthrough=True,
+        )
+
+    def _open_stream(self, path, chunk_size, byte_range, max_workers, part_size):
+        """
+        :return: a tuple of (dict describing the content being streamed, iterator of content chunks)
+        """
+        path = self._normalize_path(path)
+        if max_workers:
+            return self._open_parallel_stream(path, chunk_size, byte_range, max_workers, part_size)
+
+        response = self._get_object_range(path, byte_range)
+        stream_info = {
+            "content_length": response["ContentLength"],
+            "content_type": response.get("ContentType"),
+            "content_range": response.get("ContentRange"),
+        }
+        return stream_info, response["Body"].iter_chunks(chunk_size)
+
+    def _open_parallel_stream(self, path, chunk_size, byte_range, max_workers, part_size):
+        obj = self._get_key(path)
+        if obj is None:
+            # deliberately provoke the same error a plain GET would have raised
+            self._get_object_range(path, byte_range)
+            # the object has appeared since we looked for it, but we don't have its size to plan the parts with
+            raise S3ResponseError(
+                {
+                    "Error": {"Code": "NoSuchKey", "Message": "The specified key does not exist."},
+                    "ResponseMetadata": {"HTTPStatusCode": 404},
+                },
+                "HeadObject",
+            )
+
+        total_size = obj.content_length
+        start, end = byte_range or (0, None)
+        if byte_range and (start >= total_size or (end is not None and end < start)):
+            # as S3 would respond to the same range in a single GET
+            raise S3ResponseError(
+                {
+                    "Error": {"Code": "InvalidRange", "Message": "The requested range is not satisfiable"},
+                    "ResponseMetadata": {"HTTPStatusCode": 416},
+                },
+                "GetObject",
+            )
+        end = total_size - 1 if end is None else min(end, total_size - 1)
+        part_ranges = [
+            (part_start, min(part_start + part_size - 1, end))
+            for part_start in range(start, end + 1, part_size)
+        ]
+        stream_info = {
+            "content_length": max(end + 1 - start, 0),
+            "content_type": obj.content_type,
+            "content_range": f"bytes {start}-{end}/{total_size}" if byte_range else None,
+        }
+
+        def _fetch_part(part_range):
+            return self._get_object_range(path, part_range)["Body"].read()
+
+        def _chunks():
+            pending = deque()
+            remaining_part_ranges = iter(part_ranges)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                try:
+                    for part_range in remaining_part_ranges:
+                        pending.append(executor.submit(_fetch_part, part_range))
+                        if len(pending) >= max_workers:
+                            break
+
+                    while pending:
+                        part = pending.popleft().result()
+                        next_part_range = next(remaining_part_ranges, None)
+                        if next_part_range is not None:
+                            pending.append(executor.submit(_fetch_part, next_part_range))
+
+                        for offset in range(0, len(part), chunk_size):
+                            yield part[offset:offset + chunk_size]
+                finally:
+                    for future in pending:
+                        future.cancel()
+
+        return stream_info, _chunks()
+
+    def _get_object_range(self, path, byte_range=None):
+        extra_kwargs = {}
+        if byte_range:
+            start, end = byte_range
+            extra_kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+
+        log_description = 'get object [{filepath} range {byterange}]'
+        with log_external_request('S3', log_description) as log_context:
+            log_context.update({
+                "filepath": path,
+                "byterange": extra_kwargs.get("Range", "all"),
+            })
+
+            return self._resource.meta.client.get_object(Bucket=self.bucket_name, Key=path, **extra_kwargs)
+
+    def list(self, prefix='', delimiter='', load_timestamps=False, timestamp_workers=None):
         """
         return a list of file keys (ordered by last_modified date if load_timestamps is True) from an s3 bucket
 
         Prefix & Delimiter: http://docs.aws.amazon.com/AmazonS3/latest/dev/ListingKeysHierarchy.html
-        :param prefix:          filter by files whose names begin with the prefix
-        :param delimiter:       filter out files whose names contain the delimiter
-        :param load_timestamps: by default custom timestamps are not loaded as they require an extra API call.
-                                if you need to show the timestamp set this to True.
+        :param prefix:            filter by files whose names begin with the prefix
+        :param delimiter:         filter out files whose names contain the delimiter
+        :param load_timestamps:   by default custom timestamps are not loaded as they require an extra API call.
+                                  if you need to show the timestamp set this to True.
+        :param timestamp_workers: if set (and ``load_timestamps`` is True), the extra API calls needed to load
+                                  timestamps are made concurrently from a pool of at most this many threads
+                                  rather than one after another
         :return: list
         """
         prefix = self._normalize_path(prefix)
 
         filtered_objects = self._bucket.objects.filter(Prefix=prefix, Delimiter=delimiter)
 
+        concurrent_timestamps = load_timestamps and timestamp_workers
         with log_external_request('S3', f'list objects [prefix={prefix}, delimiter={delimiter}]'):
             # Consume the `filtered_objects` generator to memory and prepare for sorting
-            objects_for_sorting = [
-                self._format_key(obj_s, with_timestamp=load_timestamps)
+            object_summaries = [
+                obj_s
                 for obj_s in filtered_objects
                 if not (obj_s.size == 0 and obj_s.key[-1] == '/')
             ]
 
+            if not concurrent_timestamps:
+                # loading timestamps one at a time makes a HEAD request per key inside this logged duration
+                objects_for_sorting = [
+                    self._format_key(obj_s, with_timestamp=load_timestamps)
+                    for obj_s in object_summaries
+                ]
+
+        if concurrent_timestamps:
+            # (which logs its own duration)
+            objects_for_sorting = self._format_keys_concurrently(object_summaries, timestamp_workers)
+
         return sorted(objects_for_sorting, key=lambda obj_s: (obj_s.get("last_modified") or "", obj_s["path"]))
 
+    def iter_list(self, prefix='', delimiter='', start_after=None, max_keys=None, page_size=LIST_OBJECTS_PAGE_SIZE):
+        """
+        Lazily yield file keys from an s3 bucket in S3's (lexicographic) key order, fetching a page of keys at a time
+        only as needed. Timestamps are not loaded.
+
+        :param prefix:      filter by files whose names begin with the prefix
+        :param delimiter:   filter out files whose names contain the delimiter
+        :param start_after: only yield files whose paths sort after this, e.g. the last path of a previous call
+        :param max_keys:    stop after yielding this many files
+        :param page_size:   number of keys to request per page
+        :return: iterator of dicts
+        """
+        if max_keys is not None:
+            if max_keys <= 0:
+                return
+            page_size = min(page_size, max_keys)
+
+        yielded = 0
+        for page in self.iter_object_pages(prefix, delimiter, start_after, page_size):
+            for entry in page:
+                if entry["Size"] == 0 and entry["Key"][-1] == '/':
+                    continue
+
+                yield self._format_list_entry(entry)
+                yielded += 1
+                if max_keys is not None and yielded >= max_keys:
+                    return
+
+    def iter_object_pages(self, prefix='', delimiter='', start_after=None, page_size=LIST_OBJECTS_PAGE_SIZE):
+        """
+        Lazily yield pages of raw ListObjectsV2 ``Contents`` entries (dicts with ``Key``, ``Size``, ``ETag``,
+        ``LastModified`` etc.) in S3's key order, for callers needing more than ``iter_list`` gives them. Directory
+        placeholder keys are not filtered out.
+
+        :param prefix:      filter by files whose names begin with the prefix
+        :param delimiter:   filter out files whose names contain the delimiter
+        :param start_after: only list files whose paths sort after this
+        :param page_size:   number of keys to request per page
+        :return: iterator of lists of dicts
+        """
+        prefix = self._normalize_path(prefix)
+        kwargs = {}
+        if start_after:
+            kwargs["StartAfter"] = self._normalize_path(start_after)
+
+        pages = iter(self._resource.meta.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket_name,
+            Prefix=prefix,
+            Delimiter=delimiter,
+            PaginationConfig={"PageSize": page_size},
+            **kwargs
+        ))
+
+        log_description = 'list objects page [prefix={prefix}, delimiter={delimiter}, start_after={start_after}]'
+        while True:
+            with log_external_request('S3', log_description) as log_context:
+                log_context.update({
+                    "prefix": prefix,
+                    "delimiter": delimiter,
+                    "start_after": kwargs.get("StartAfter"),
+                })
+                page = next(pages, None)
+
+            if page is None:
+                return
+            yield page.get("Contents", [])
+
+    @staticmethod
+    def _format_list_entry(entry):
+        """
+        Transform a raw ListObjectsV2 ``Contents`` entry into the same dict ``_format_key`` would produce for an
+        ObjectSummary without timestamps
+        """
+        filename, ext = os.path.splitext(os.path.basename(entry["Key"]))
+        return {
+            'path': entry["Key"],
+            'filename': filename,
+            'ext': ext[1:],
+            'size': entry["Size"],
+        }
+
+    def _format_keys_concurrently(self, object_summaries, max_workers):
+        """
+        Equivalent of calling ``_format_key(obj_s, with_timestamp=True)`` for each of ``object_summaries``, but
+        performing the required HEAD requests from a pool of up to ``max_workers`` threads. the workers talk to the
+        client directly rather than loading an ``Object`` for each key, so each HEAD request can be timed.
+        """
+        client = self._resource.meta.client
+        head_durations = []
+
+        def _head(obj_s):
+            start_time = time.perf_counter()
+            response = client.head_object(Bucket=self.bucket_name, Key=obj_s.key)
+            head_durations.append(time.perf_counter() - start_time)
+            return self._format_head_response(obj_s.key, response)
+
+        log_description = (
+            'load timestamps [{key_count} keys with concurrency {concurrency}, total HEAD time {head_duration}s]'
+        )
+        with log_external_request('S3', log_description) as log_context:
+            log_context.update({
+                "key_count": len(object_summaries),
+                "concurrency": max_workers,
+            })
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # executor.map preserves the ordering of its input
+                    return list(executor.map(_head, object_summaries))
+            finally:
+                log_context["head_duration"] = sum(head_durations)
+
+    def _format_head_response(self, key, response):
+        """
+        Transform a (client-level) head_object response for ``key`` into the same dict ``_format_key`` would produce
+        for an Object
+        """
+        filename, ext = os.path.splitext(os.path.basename(key))
+        metadata = response.get("Metadata") or {}
+        return {
+            'path': key,
+            'filename': filename,
+            'ext': ext[1:],
+            'size': response["ContentLength"],
+            'last_modified': (
+                (metadata.get("timestamp") and parse_time(metadata["timestamp"])) or response["LastModified"]
+            ).strftime(DATETIME_FORMAT),
+        }
+
     def _format_key(self, obj, with_timestamp=True):
         """
         Transform a boto3 s3 Object or ObjectSummary object into a (simpler, implementation-abstracted) dict
@@ -246,6 +1294,31 @@ class S3(object):
         return mimetype
 
 
+def get_content_disposition(download_filename, disposition_type="attachment"):
+    """Content-Disposition header value suggesting ``download_filename`` as the name for a browser to download"""
+    return u'{}; filename="{}"'.format(
+        disposition_type,
+        # boto/aws can't cope with unicode here, but wants the ultimate result as a `str` in py3, so doing this
+        # to strip non-ascii chars..
+        str(download_filename).encode("ascii", errors="ignore").decode(),
+    )
+
+
+def get_file_digest(file_, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return the hex SHA-256 digest of a file's contents from its current position, restoring the position after"""
+    if hasattr(file_, "buffer"):
+        # presumably a TextIO object - we want to deal with things on a byte-level though...
+        file_ = file_.buffer
+
+    original_pos = file_.tell()
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file_.read(chunk_size), b""):
+        digest.update(chunk)
+    file_.seek(original_pos)
+
+    return digest.hexdigest()
+
+
 def get_file_size(file_):
     if hasattr(file_, "buffer"):
         # presumably a TextIO object - we want to deal with things on a byte-level though...
@@ -0,0 +1,203 @@
+"""
+Streaming zip archives of objects stored in S3, built without holding whole files in memory
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import queue
+import threading
+import zipfile
+
+import flask
+
+from .s3 import DEFAULT_CHUNK_SIZE, get_content_disposition
+
+
+# marker passed from an object's fetcher thread to the zip writer once it's done
+_END_OF_OBJECT = object()
+
+
+class _ZipOutput(io.RawIOBase):
+    """
+    Write-only, non-seekable sink for ``zipfile`` which lets the zip writer hand over the bytes written so far. Being
+    non-seekable causes ``zipfile`` to use data descriptors rather than going back to patch up local file headers.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer.extend(b)
+        return len(b)
+
+    def drain(self):
+        """Yield (at most once) any bytes written since the last call"""
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            yield data
+
+
+class _IteratorStream(io.RawIOBase):
+    """
+    Readable, non-seekable stream over an iterator of ``bytes``
+    """
+    def __init__(self, iterator):
+        self._iterator = iterator
+        self._leftover = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._leftover:
+            self._leftover = next(self._iterator, None)
+            if self._leftover is None:
+                self._leftover = b""
+                return 0
+
+        length = min(len(b), len(self._leftover))
+        b[:length] = self._leftover[:length]
+        self._leftover = self._leftover[length:]
+        return length
+
+
+def _get_entries(s3, prefix, paths):
+    """
+    Return an iterator of ``(path, arcname, size)`` tuples, ``size`` being None if not known in advance
+    """
+    if paths is not None:
+        return ((path.lstrip("/"), path.lstrip("/"), None) for path in paths)
+
+    prefix = prefix.lstrip("/")
+    return (
+        (key["path"], key["path"][len(prefix):].lstrip("/") or os.path.basename(key["path"]), key["size"])
+        for key in s3.iter_list(prefix)
+    )
+
+
+def _fetch_object(s3, path, chunk_size, chunks_queue, stop_event):
+    """
+    Pull the contents of ``path`` into ``chunks_queue``, blocking whenever it's full. Gives up if ``stop_event`` gets
+    set so abandoned fetchers don't hang around forever.
+    """
+    def _put(item):
+        while not stop_event.is_set():
+            try:
+                chunks_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for chunk in s3.iter_chunks(path, chunk_size=chunk_size):
+            if not _put(chunk):
+                return
+        _put(_END_OF_OBJECT)
+    except Exception as e:
+        _put(e)
+
+
+def iter_zip(s3, prefix=None, paths=None, max_workers=4, chunk_size=DEFAULT_CHUNK_SIZE, prefetch_chunks=16,
+             compression=zipfile.ZIP_STORED):
+    """
+    Generate a zip archive of objects in an S3 bucket, chunk by chunk
+
+    Objects are fetched concurrently ahead of being written to the archive, but at most ``max_workers`` objects are
+    in flight at once, each holding at most ``prefetch_chunks`` chunks of ``chunk_size`` bytes, so memory use is
+    bounded regardless of object sizes.
+
+    :param s3:              ``dmutils.s3.S3`` instance for the bucket containing the objects
+    :param prefix:          archive all objects with paths beginning with this. they will be named relative to it
+                            within the archive
+    :param paths:           alternatively, an iterable of paths of the objects to archive. they will be named by
+                            their full path within the archive
+    :param max_workers:     maximum number of objects to fetch concurrently
+    :param chunk_size:      maximum size in bytes of each chunk fetched from S3
+    :param prefetch_chunks: maximum number of chunks to buffer for each object being fetched
+    :param compression:     ``zipfile`` compression method. our documents are generally already compressed, so by
+                            default they're stored as-is
+
+    :return: iterator of ``bytes``
+    :raises: botocore.exceptions.ClientError if an object can't be fetched
+    """
+    if (prefix is None) == (paths is None):
+        raise TypeError("Exactly one of prefix or paths must be specified")
+
+    entries = _get_entries(s3, prefix, paths)
+    output = _ZipOutput()
+    stop_event = threading.Event()
+    in_flight = deque()
+
+    def _start_next():
+        entry = next(entries, None)
+        if entry is not None:
+            chunks_queue = queue.Queue(maxsize=prefetch_chunks)
+            executor.submit(_fetch_object, s3, entry[0], chunk_size, chunks_queue, stop_event)
+            in_flight.append((entry, chunks_queue))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for _ in range(max_workers):
+                _start_next()
+
+            with zipfile.ZipFile(output, mode="w", compression=compression, allowZip64=True) as zip_file:
+                while in_flight:
+                    (path, arcname, size), chunks_queue = in_flight.popleft()
+
+                    # sizes we don't know in advance could be anything, so must allow for them being large
+                    force_zip64 = size is None or size > zipfile.ZIP64_LIMIT
+                    with zip_file.open(arcname, mode="w", force_zip64=force_zip64) as member:
+                        while True:
+                            item = chunks_queue.get()
+                            if item is _END_OF_OBJECT:
+                                break
+                            if isinstance(item, Exception):
+                                raise item
+                            member.write(item)
+                            yield from output.drain()
+
+                    _start_next()
+                    yield from output.drain()
+
+            # the zip file's central directory is written on closing
+            yield from output.drain()
+        finally:
+            stop_event.set()
+
+
+def zip_streaming_response(s3, download_filename="documents.zip", **kwargs):
+    """
+    Return a flask ``Response`` streaming a zip archive of objects in an S3 bucket. Arguments are as for ``iter_zip``.
+    """
+    return flask.Response(
+        iter_zip(s3, **kwargs),
+        content_type="application/zip",
+        headers={"Content-Disposition": get_content_disposition(download_filename)},
+        direct_passthrough=True,
+    )
+
+
+def save_zip(s3, target_s3, target_path, acl="bucket-owner-full-control", download_filename=None, **kwargs):
+    """
+    Stream a zip archive of objects in an S3 bucket into a new object, without holding the whole archive in memory
+
+    :param s3:          ``dmutils.s3.S3`` instance for the bucket containing the objects
+    :param target_s3:   ``dmutils.s3.S3`` instance for the bucket to save the archive in
+    :param target_path: path to save the archive at
+    :param acl:         S3 canned ACL for the archive
+    :param download_filename: Suggested name for a browser to download, part of Content-Disposition header
+    :param kwargs:      further arguments for ``iter_zip``
+
+    :return: S3 Key of the archive
+    """
+    return target_s3.save_stream(
+        target_path,
+        _IteratorStream(iter_zip(s3, **kwargs)),
+        acl=acl,
+        download_filename=download_filename,
+    )
@@ -0,0 +1,294 @@
+"""
+A stand-in for ``dmutils.s3.S3`` which keeps objects on the local filesystem, for use in tests, benchmarks and local
+development without S3 (or moto)
+
+Select it for an app by setting ``DM_S3_BACKEND`` to ``"local"`` and ``DM_S3_LOCAL_ROOT`` to the directory to keep
+buckets in - ``S3(...)`` will then return a ``LocalS3`` instead. ``DM_S3_LOCAL_BASE_URL`` optionally sets the base of
+the URLs it hands out.
+"""
+from collections import Counter
+import datetime
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+
+from .formats import DATETIME_FORMAT
+from .s3 import (
+    DEFAULT_CHUNK_SIZE,
+    DELETE_OBJECTS_BATCH_SIZE,
+    LIST_OBJECTS_PAGE_SIZE,
+    S3,
+    S3ResponseError,
+    get_content_disposition,
+)
+
+
+_OBJECTS_DIR = "objects"
+_METADATA_DIR = "metadata"
+_METADATA_SUFFIX = ".json"
+
+
+def _no_such_key_error(path, operation_name):
+    return S3ResponseError(
+        {
+            "Error": {"Code": "NoSuchKey", "Message": f"The specified key does not exist: {path}"},
+            "ResponseMetadata": {"HTTPStatusCode": 404},
+        },
+        operation_name,
+    )
+
+
+class LocalS3(object):
+    """
+    Implements the main methods of ``dmutils.s3.S3`` - ``save``, ``copy``, ``list``, ``iter_list``, ``get_key``,
+    ``path_exists``, ``iter_chunks``, ``delete_key``, ``delete_keys`` and ``get_signed_url`` - returning the same
+    dicts, with each bucket a directory under ``root``. Object contents are kept under ``<bucket>/objects/`` and their
+    metadata in JSON "sidecar" files under ``<bucket>/metadata/``.
+
+    ``calls`` counts the S3 API requests the real ``S3`` would have made for the same method calls (by operation name,
+    e.g. ``"HeadObject"``), so tests can catch changes which would add requests.
+    """
+    def __init__(self, bucket_name, root, base_url=None):
+        """
+        :param bucket_name: name of the bucket this instance operates on
+        :param root:        local directory buckets are kept in
+        :param base_url:    base of the URLs returned by ``get_signed_url``. by default ``file://`` URLs are returned
+        """
+        self._bucket_name = bucket_name
+        self._root = os.path.abspath(root)
+        self._base_url = base_url
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def bucket_name(self):
+        return self._bucket_name
+
+    def _count(self, operation_name, n=1):
+        with self._lock:
+            self.calls[operation_name] += n
+
+    def _object_path(self, path, bucket_name=None):
+        return os.path.join(self._root, bucket_name or self._bucket_name, _OBJECTS_DIR, *path.split("/"))
+
+    def _metadata_path(self, path, bucket_name=None):
+        return os.path.join(
+            self._root, bucket_name or self._bucket_name, _METADATA_DIR, *path.split("/")
+        ) + _METADATA_SUFFIX
+
+    @staticmethod
+    def _write_atomically(target_path, write):
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        temp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                write(f)
+            os.replace(temp_path, target_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _write_object(self, path, file_, sidecar):
+        digest = hashlib.md5()
+
+        def _write_contents(f):
+            for chunk in iter(lambda: file_.read(DEFAULT_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                f.write(chunk)
+
+        self._write_atomically(self._object_path(path), _write_contents)
+        sidecar = {
+            **sidecar,
+            "etag": digest.hexdigest(),
+            "last_modified": datetime.datetime.utcnow().strftime(DATETIME_FORMAT),
+        }
+        self._write_atomically(self._metadata_path(path), lambda f: f.write(json.dumps(sidecar).encode("utf-8")))
+
+    def _read_sidecar(self, path, bucket_name=None):
+        try:
+            with open(self._metadata_path(path, bucket_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _format_key(self, path, sidecar, size, with_timestamp=True):
+        filename, ext = os.path.splitext(os.path.basename(path))
+        keydict = {
+            "path": path,
+            "filename": filename,
+            "ext": ext[1:],
+            "size": size,
+        }
+        if with_timestamp:
+            # as with S3, prefer our custom "timestamp" metadata field over the actual last modified time
+            keydict["last_modified"] = sidecar["metadata"].get("timestamp") or sidecar["last_modified"]
+
+        return keydict
+
+    def _head(self, path, bucket_name=None):
+        """Equivalent of a HEAD request, returning a key dict or None"""
+        self._count("HeadObject")
+        sidecar = self._read_sidecar(path, bucket_name)
+        if sidecar is None:
+            return None
+        return self._format_key(path, sidecar, os.path.getsize(self._object_path(path, bucket_name)))
+
+    def save(self, path, file_, acl='public-read', timestamp=None, download_filename=None,
+             disposition_type='attachment', **kwargs):
+        """As for ``S3.save``. S3-specific options such as ``dedupe_prefix`` are accepted but ignored."""
+        path = S3._normalize_path(path)
+        if hasattr(file_, "buffer"):
+            file_ = file_.buffer
+
+        timestamp = timestamp or datetime.datetime.utcnow()
+        self._count("PutObject")
+        self._write_object(path, file_, {
+            "acl": acl,
+            "content_type": S3._get_mimetype(path),
+            "content_disposition": (
+                get_content_disposition(download_filename, disposition_type) if download_filename else None
+            ),
+            "metadata": {"timestamp": timestamp.strftime(DATETIME_FORMAT)},
+        })
+
+        return self._head(path)
+
+    def copy(self, src_bucket, src_key, target_key, acl=None):
+        """As for ``S3.copy``"""
+        target_key = S3._normalize_path(target_key)
+        if self.path_exists(target_key):
+            raise ValueError('Target key already exists in S3.')
+
+        src_key = S3._normalize_path(src_key)
+        # boto3's managed copy checks the size of the source first
+        self._count("HeadObject")
+        sidecar = self._read_sidecar(src_key, src_bucket)
+        if sidecar is None:
+            raise _no_such_key_error(src_key, "HeadObject")
+
+        self._count("CopyObject")
+        with open(self._object_path(src_key, src_bucket), "rb") as f:
+            self._write_object(target_key, f, {**sidecar, "acl": acl or "private"})
+
+        return self._head(target_key)
+
+    def path_exists(self, path):
+        return self._head(S3._normalize_path(path)) is not None
+
+    def get_key(self, path):
+        return self._head(S3._normalize_path(path))
+
+    def get_signed_url(self, path, expires_in=30):
+        """As for ``S3.get_signed_url``. URLs aren't actually signed, but do carry their expiry time."""
+        path = S3._normalize_path(path)
+        if self.path_exists(path):
+            self._count("Presign")
+            expires = int(time.time()) + expires_in
+            if self._base_url:
+                return f"{self._base_url.rstrip('/')}/{self._bucket_name}/{path}?Expires={expires}"
+            return f"{pathlib.Path(self._object_path(path)).as_uri()}?Expires={expires}"
+
+    def _remove(self, path):
+        for file_path in (self._object_path(path), self._metadata_path(path)):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+    def delete_key(self, path):
+        self._count("DeleteObject")
+        self._remove(S3._normalize_path(path))
+
+    def delete_keys(self, paths, max_workers=None):
+        """As for ``S3.delete_keys``"""
+        paths = list(dict.fromkeys(S3._normalize_path(path) for path in paths))
+        for i in range(0, len(paths), DELETE_OBJECTS_BATCH_SIZE):
+            self._count("DeleteObjects")
+            for path in paths[i:i + DELETE_OBJECTS_BATCH_SIZE]:
+                self._remove(path)
+
+        return {"deleted": paths, "errors": {}}
+
+    def _iter_paths(self, prefix, delimiter, start_after=None):
+        """Yield ``(path, size)`` for each stored object matching ``prefix`` and ``delimiter``, in S3's key order"""
+        objects_root = os.path.join(self._root, self._bucket_name, _OBJECTS_DIR)
+        # no need to walk any more of the tree than the prefix could match
+        walk_root = os.path.join(objects_root, *prefix.split("/")[:-1])
+
+        paths = []
+        for dirpath, _, filenames in os.walk(walk_root):
+            relative_dir = os.path.relpath(dirpath, objects_root)
+            for filename in filenames:
+                path = filename if relative_dir == "." else "/".join((*relative_dir.split(os.sep), filename))
+                if not path.startswith(prefix):
+                    continue
+                if delimiter and delimiter in path[len(prefix):]:
+                    continue
+                if start_after is not None and path.encode("utf-8") <= start_after.encode("utf-8"):
+                    continue
+                paths.append(path)
+
+        for path in sorted(paths, key=lambda p: p.encode("utf-8")):
+            yield path, os.path.getsize(self._object_path(path))
+
+    def list(self, prefix='', delimiter='', load_timestamps=False, timestamp_workers=None):
+        """As for ``S3.list``"""
+        prefix = S3._normalize_path(prefix)
+        paths = list(self._iter_paths(prefix, delimiter))
+        self._count("ListObjects", max(1, -(-len(paths) // LIST_OBJECTS_PAGE_SIZE)))
+
+        if load_timestamps:
+            keys = [self._head(path) for path, _ in paths]
+        else:
+            keys = [self._format_key(path, None, size, with_timestamp=False) for path, size in paths]
+
+        return sorted(keys, key=lambda key: (key.get("last_modified") or "", key["path"]))
+
+    def iter_list(self, prefix='', delimiter='', start_after=None, max_keys=None, page_size=LIST_OBJECTS_PAGE_SIZE):
+        """As for ``S3.iter_list``"""
+        prefix = S3._normalize_path(prefix)
+        start_after = start_after and S3._normalize_path(start_after)
+
+        yielded = 0
+        for path, size in self._iter_paths(prefix, delimiter, start_after):
+            if max_keys is not None and yielded >= max_keys:
+                return
+            if yielded % page_size == 0:
+                self._count("ListObjectsV2")
+            yield self._format_key(path, None, size, with_timestamp=False)
+            yielded += 1
+
+        if yielded == 0 and (max_keys is None or max_keys > 0):
+            self._count("ListObjectsV2")
+
+    def iter_chunks(self, path, chunk_size=DEFAULT_CHUNK_SIZE, byte_range=None, **kwargs):
+        """As for ``S3.iter_chunks``. Parallel fetching options are accepted but ignored."""
+        path = S3._normalize_path(path)
+        self._count("GetObject")
+        try:
+            f = open(self._object_path(path), "rb")
+        except FileNotFoundError:
+            raise _no_such_key_error(path, "GetObject")
+
+        return self._iter_file_chunks(f, chunk_size, byte_range)
+
+    @staticmethod
+    def _iter_file_chunks(f, chunk_size, byte_range):
+        with f:
+            remaining = None
+            if byte_range is not None:
+                start, end = byte_range
+                f.seek(start)
+                if end is not None:
+                    remaining = end - start + 1
+
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
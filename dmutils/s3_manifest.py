@@ -0,0 +1,136 @@
+"""
+Local snapshots of the listing of an S3 prefix which can be refreshed incrementally, so that jobs repeatedly walking
+a large prefix only need to deal with what has changed since last time
+"""
+import json
+import logging
+import os
+
+from .formats import DATETIME_FORMAT
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMAT_VERSION = 1
+# default number of already-known keys preceding the last known key to list again on an incremental refresh
+DEFAULT_RECHECK_WINDOW = 100
+
+
+class S3PrefixManifest(object):
+    """
+    A compact snapshot of the keys under a prefix in an S3 bucket, with their size, etag and last modified time, kept
+    in a local JSON file
+
+    An incremental ``refresh`` only lists keys after the last known key, along with a window of ``recheck_window``
+    known keys before it. Anything happening earlier in the listing than that - including keys being *added* there,
+    not just changed or removed - won't be noticed until the next full refresh. As keys are listed in name order
+    rather than the order they were created in, under a prefix covering many suppliers that is where most new
+    uploads land (e.g. a new version of supplier 100's document sorts before supplier 999's keys), so an incremental
+    refresh is only a cheap way of picking up keys added at the end of the listing. Jobs which need to see every new
+    key should use ``refresh(full=True)``.
+    """
+    def __init__(self, s3, prefix, manifest_path, recheck_window=DEFAULT_RECHECK_WINDOW):
+        """
+        :param s3:             ``dmutils.s3.S3`` instance for the bucket
+        :param prefix:         prefix of the keys to keep track of
+        :param manifest_path:  local filesystem path of the manifest file. it needn't exist yet
+        :param recheck_window: number of known keys before the last known key to list again on an incremental refresh
+        """
+        self._s3 = s3
+        self.prefix = prefix.lstrip("/")
+        self.manifest_path = manifest_path
+        self.recheck_window = recheck_window
+        self._entries = self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        """Return a list of the known keys, in S3 listing order"""
+        return list(self._entries)
+
+    def get(self, key):
+        """Return a dict of the ``size``, ``etag`` and ``last_modified`` of a known key, or None"""
+        entry = self._entries.get(key)
+        return entry and dict(zip(("size", "etag", "last_modified"), entry))
+
+    def _load(self):
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {}
+
+        if manifest.get("version") != MANIFEST_FORMAT_VERSION or manifest.get("prefix") != self.prefix:
+            # we can't trust this, so will have to start from scratch
+            return {}
+
+        return {key: tuple(entry) for key, *entry in manifest["keys"]}
+
+    def _save(self):
+        manifest = {
+            "version": MANIFEST_FORMAT_VERSION,
+            "prefix": self.prefix,
+            "keys": [[key, *entry] for key, entry in self._entries.items()],
+        }
+        # write to a temporary file first so a failure part way through can't leave a corrupt manifest behind
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(temp_path, self.manifest_path)
+
+    def refresh(self, full=False):
+        """
+        Bring the manifest up to date with the bucket and save it
+
+        :param full: if True, list the whole prefix again rather than refreshing incrementally
+
+        :return: dict with keys ``added``, ``changed`` and ``removed``, each a list of keys. for an incremental
+                 refresh these only cover the recheck window and the keys after it - keys added, changed or removed
+                 earlier in the listing are missing from all three
+        """
+        known_keys = list(self._entries)
+        if full or len(known_keys) <= self.recheck_window:
+            start_after = None
+            recheck_keys = known_keys
+        else:
+            start_after = known_keys[-self.recheck_window - 1]
+            recheck_keys = known_keys[-self.recheck_window:]
+
+        delta = {"added": [], "changed": [], "removed": []}
+        listed_keys = set()
+        new_entries = {}
+        for page in self._s3.iter_object_pages(self.prefix, start_after=start_after):
+            for obj in page:
+                key = obj["Key"]
+                entry = (obj["Size"], obj["ETag"].strip('"'), obj["LastModified"].strftime(DATETIME_FORMAT))
+                listed_keys.add(key)
+                new_entries[key] = entry
+
+                if key not in self._entries:
+                    delta["added"].append(key)
+                elif self._entries[key] != entry:
+                    delta["changed"].append(key)
+
+        delta["removed"] = [key for key in recheck_keys if key not in listed_keys]
+
+        for key in delta["removed"]:
+            del self._entries[key]
+        self._entries.update(new_entries)
+        # S3 lists keys in (utf-8 binary) order, which we rely on to know where to pick up from next time
+        self._entries = dict(sorted(self._entries.items(), key=lambda item: item[0].encode("utf-8")))
+        self._save()
+
+        logger.info(
+            "Refreshed manifest of {prefix}: {added} added, {changed} changed, {removed} removed",
+            extra={
+                "prefix": self.prefix,
+                "full": start_after is None,
+                **{k: len(v) for k, v in delta.items()},
+            },
+        )
+
+        return delta
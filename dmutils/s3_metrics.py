@@ -0,0 +1,182 @@
+"""
+Prometheus metrics for the S3 requests made through ``dmutils.s3``, along with a per-request summary to help spot
+patterns such as a HEAD request per item of a listing
+
+Metrics are opt-in, being enabled by ``init_app`` or the ``DM_S3_METRICS`` config flag. Until then ``gds_metrics``
+isn't imported (importing it switches the whole process into prometheus' multiprocess mode, which leaves files behind
+in the multiprocess directory) and no event handlers are attached to S3 clients.
+"""
+import threading
+import time
+
+from botocore.utils import determine_content_length
+import flask
+
+
+_enabled = False
+_metrics = None
+_metrics_lock = threading.Lock()
+
+# operations which send object contents in the request body
+_UPLOAD_OPERATIONS = frozenset(("PutObject", "UploadPart"))
+# operations which receive object contents in the response body
+_DOWNLOAD_OPERATIONS = frozenset(("GetObject",))
+
+
+def _before_parameter_build(params, model, context, **kwargs):
+    if context.get("is_presign_request"):
+        return
+
+    context["dm_s3_metrics"] = {
+        "operation": model.name,
+        "bucket": params.get("Bucket", ""),
+        "start_time": time.perf_counter(),
+        "upload_bytes": (
+            determine_content_length(params.get("Body", b"")) if model.name in _UPLOAD_OPERATIONS else None
+        ),
+    }
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    download_bytes = None
+    if model.name in _DOWNLOAD_OPERATIONS and http_response.status_code < 300:
+        download_bytes = parsed.get("ContentLength")
+
+    _record(context, str(http_response.status_code), download_bytes)
+
+
+def _after_call_error(exception, context, **kwargs):
+    # e.g. connection errors, after botocore has given up retrying
+    _record(context, "error", None)
+
+
+def _record(context, status, download_bytes):
+    state = context.pop("dm_s3_metrics", None)
+    if state is None:
+        return
+
+    record_s3_request(
+        state["operation"],
+        state["bucket"],
+        status,
+        time.perf_counter() - state["start_time"],
+        upload_bytes=state["upload_bytes"] if status.startswith("2") else None,
+        download_bytes=download_bytes,
+    )
+
+
+def _get_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            from gds_metrics.metrics import Counter, Histogram
+
+            _metrics = {
+                "requests_total": Counter(
+                    "dm_s3_requests_total",
+                    "Total S3 requests",
+                    ["operation", "bucket", "status"],
+                ),
+                "request_duration_seconds": Histogram(
+                    "dm_s3_request_duration_seconds",
+                    "S3 request duration in seconds",
+                    ["operation", "bucket"],
+                ),
+                "transferred_bytes_total": Counter(
+                    "dm_s3_transferred_bytes_total",
+                    "Total bytes of object contents sent to or received from S3",
+                    ["operation", "bucket", "direction"],
+                ),
+            }
+
+        return _metrics
+
+
+def s3_metrics_enabled():
+    """Whether S3 metrics are being recorded in this process"""
+    return _enabled
+
+
+def enable_s3_metrics():
+    """
+    Start recording S3 metrics in this process. Only clients created from now on record their requests
+    automatically, so shared clients created before this are discarded.
+    """
+    global _enabled
+    if _enabled:
+        return
+
+    _get_metrics()
+    _enabled = True
+
+    # imported here as s3 itself builds on this module
+    from .s3 import reset_resource_cache
+    reset_resource_cache()
+
+
+def record_s3_request(operation, bucket, status, duration, upload_bytes=None, download_bytes=None):
+    """
+    Record an S3 request in the prometheus metrics and, if there is one, the current request's summary. This is done
+    automatically for requests made through clients with ``register_s3_metrics_handlers`` applied, so only needs
+    calling directly for work done outside botocore's request cycle, such as presigning. Does nothing unless S3
+    metrics are enabled.
+    """
+    if not _enabled:
+        return
+
+    metrics = _get_metrics()
+    metrics["requests_total"].labels(operation, bucket, status).inc()
+    metrics["request_duration_seconds"].labels(operation, bucket).observe(duration)
+    if upload_bytes:
+        metrics["transferred_bytes_total"].labels(operation, bucket, "upload").inc(upload_bytes)
+    if download_bytes:
+        metrics["transferred_bytes_total"].labels(operation, bucket, "download").inc(download_bytes)
+
+    # calls made from worker threads without an app context can't be attributed to a request
+    if flask.has_app_context():
+        summary = flask.g.setdefault("_dm_s3_request_summary", {})
+        operation_summary = summary.setdefault(operation, {"count": 0, "duration": 0.0, "bytes": 0})
+        operation_summary["count"] += 1
+        operation_summary["duration"] += duration
+        operation_summary["bytes"] += (upload_bytes or 0) + (download_bytes or 0)
+
+
+def register_s3_metrics_handlers(client):
+    """Attach our metrics-recording event handlers to a boto3 s3 client"""
+    events = client.meta.events
+    events.register("before-parameter-build.s3", _before_parameter_build, unique_id="dm-s3-metrics-before-build")
+    events.register("after-call.s3", _after_call, unique_id="dm-s3-metrics-after-call")
+    events.register("after-call-error.s3", _after_call_error, unique_id="dm-s3-metrics-after-call-error")
+
+
+def get_request_s3_summary():
+    """
+    Return a dict mapping each S3 operation performed so far in the current app context to a dict of its ``count``,
+    total ``duration`` and total ``bytes`` transferred
+    """
+    return flask.g.get("_dm_s3_request_summary", {})
+
+
+def init_app(app):
+    """
+    Enable S3 metrics and log a summary of each request's S3 usage at the end of the request, if it made any S3
+    requests
+    """
+    enable_s3_metrics()
+
+    @app.after_request
+    def log_s3_request_summary(response):
+        summary = get_request_s3_summary()
+        if summary:
+            app.logger.info(
+                "S3 usage for {method} {url}: {s3_request_count} requests taking {s3_duration}s",
+                extra={
+                    "method": flask.request.method,
+                    "url": flask.request.url,
+                    "s3_request_count": sum(op["count"] for op in summary.values()),
+                    "s3_duration": sum(op["duration"] for op in summary.values()),
+                    "s3_bytes": sum(op["bytes"] for op in summary.values()),
+                    "s3_operations": summary,
+                },
+            )
+        return response
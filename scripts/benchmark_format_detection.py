@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Compare the time taken to identify the format of each of our test files using dmutils' own signature table and
+fleep's full signature database.
+
+Usage:
+    python scripts/benchmark_format_detection.py [--number=<n>] [--files=<dir>]
+
+Options:
+    --number=<n>   Detections per file per detector [default: 20000]
+    --files=<dir>  Directory of files to identify [default: tests/test_files]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+import fleep
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dmutils.documents import get_possible_extensions_from_header  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    parser.add_argument("--files", default="tests/test_files")
+    args = parser.parse_args()
+
+    print(f"{'file':<20} {'fleep (us)':>12} {'dmutils (us)':>14} {'speedup':>9}  formats")
+    for file_name in sorted(os.listdir(args.files)):
+        with open(os.path.join(args.files, file_name), "rb") as f:
+            header = f.read(128)
+
+        fleep_time = timeit.timeit(lambda: fleep.get(header).extension, number=args.number)
+        dmutils_time = timeit.timeit(lambda: get_possible_extensions_from_header(header), number=args.number)
+
+        print(
+            f"{file_name:<20} {fleep_time / args.number * 1e6:>12.2f} {dmutils_time / args.number * 1e6:>14.2f} "
+            f"{fleep_time / dmutils_time:>8.1f}x  {get_possible_extensions_from_header(header)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Time AppStackLocationFilter finding the first "app" frame of a warning logged from deep inside a Flask request
+rendering nested Jinja macros, with and without its memo of which code filenames are within the app, both where the
+walk finds an app frame (a view) and where it walks the whole stack without finding one.
+
+Usage:
+    python scripts/benchmark_stack_location_filter.py [--number=<n>] [--macro-depth=<n>]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import timeit
+
+from flask import Flask, render_template_string
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dmutils.logging import AppStackLocationFilter  # noqa: E402
+
+
+class _UnmemoizedAppStackLocationFilter(AppStackLocationFilter):
+    def is_interesting_frame(self, frame):
+        self._is_app_filename.clear()
+        return super().is_interesting_frame(frame)
+
+
+# a view, compiled below as if it were a module of an app under app_root
+VIEW_SOURCE = """
+def view():
+    return render_template_string(TEMPLATE, depth=DEPTH, measure=measure)
+"""
+
+TEMPLATE = """
+{%- macro nested(depth) -%}
+  {%- if depth -%}{{ nested(depth - 1) }}{%- else -%}{{ measure() }}{%- endif -%}
+{%- endmacro -%}
+{{ nested(depth) }}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--macro-depth", type=int, default=10)
+    args = parser.parse_args()
+
+    # (only used as a path - nothing needs to exist there)
+    app_root = os.path.join(tempfile.gettempdir(), "benchmark-app")
+    app = Flask("benchmark", root_path=app_root)
+    record = logging.makeLogRecord({"msg": "Something's up", "levelno": logging.WARNING, "levelname": "WARNING"})
+    results = {}
+
+    def measure():
+        stack_depth = 0
+        frame = sys._getframe()
+        while frame is not None:
+            stack_depth += 1
+            frame = frame.f_back
+
+        for name, filter_class, root_path in (
+            ("unmemoized, app frame found", _UnmemoizedAppStackLocationFilter, app_root),
+            ("memoized, app frame found", AppStackLocationFilter, app_root),
+            ("unmemoized, no app frame", _UnmemoizedAppStackLocationFilter, os.path.join(app_root, "elsewhere")),
+            ("memoized, no app frame", AppStackLocationFilter, os.path.join(app_root, "elsewhere")),
+        ):
+            filter_ = filter_class("app_", root_path)
+            results[name] = (stack_depth, timeit.timeit(lambda: filter_.filter(record), number=args.number))
+
+        return ""
+
+    namespace = {
+        "render_template_string": render_template_string,
+        "TEMPLATE": TEMPLATE,
+        "DEPTH": args.macro_depth,
+        "measure": measure,
+    }
+    exec(compile(VIEW_SOURCE, os.path.join(app_root, "views.py"), "exec"), namespace)
+    app.add_url_rule("/", "view", namespace["view"])
+
+    assert app.test_client().get("/").status_code == 200
+
+    for name, (stack_depth, duration) in results.items():
+        print(f"{name:<30} {stack_depth:>4} frames  {duration / args.number * 1e6:>9.2f}us per record")
+
+
+if __name__ == "__main__":
+    main()
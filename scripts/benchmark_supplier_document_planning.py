@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Compare planning a framework-wide result letter job with per-supplier calls to ``get_document_path`` and
+``generate_download_filename`` (with the previous ``str.replace``-based ``sanitise_supplier_name``) against
+``plan_supplier_documents``, and time ``plan_supplier_documents`` signing URLs against a local S3 bucket, with a
+simulated round trip for the HEAD request S3 makes before signing each URL.
+
+Usage:
+    python scripts/benchmark_supplier_document_planning.py [--suppliers=<n>] [--number=<n>] [--signed-suppliers=<n>]
+        [--head-latency=<ms>] [--max-workers=<n>]
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import timeit
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from dmutils.documents import (  # noqa: E402
+    BAD_SUPPLIER_NAME_CHARACTERS,
+    RESULT_LETTER_FILENAME,
+    get_document_path,
+    plan_supplier_documents,
+)
+from dmutils.s3_local import LocalS3  # noqa: E402
+
+
+def _replace_based_sanitise_supplier_name(supplier_name):
+    sanitised_supplier_name = supplier_name.encode("ascii", errors="ignore").decode("ascii").strip()
+    sanitised_supplier_name = sanitised_supplier_name.replace(' ', '_').replace('&', 'and')
+    for bad_char in BAD_SUPPLIER_NAME_CHARACTERS:
+        sanitised_supplier_name = sanitised_supplier_name.replace(bad_char, '')
+    while '__' in sanitised_supplier_name:
+        sanitised_supplier_name = sanitised_supplier_name.replace('__', '_')
+    return sanitised_supplier_name
+
+
+def _per_supplier_plan(suppliers):
+    return [
+        (
+            get_document_path("g-cloud-12", supplier["supplierId"], "documents", RESULT_LETTER_FILENAME),
+            "{}-{}-{}".format(
+                _replace_based_sanitise_supplier_name(supplier["supplierName"]),
+                supplier["supplierId"],
+                RESULT_LETTER_FILENAME,
+            ),
+        )
+        for supplier in suppliers
+    ]
+
+
+def _bulk_plan(suppliers, **kwargs):
+    return [
+        (planned_document.path, planned_document.download_filename)
+        for planned_document in plan_supplier_documents(
+            "g-cloud-12", suppliers, "documents", RESULT_LETTER_FILENAME, **kwargs
+        )
+    ]
+
+
+class _RemoteLocalS3(LocalS3):
+    def __init__(self, *args, head_latency, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._head_latency = head_latency
+
+    def _head(self, *args, **kwargs):
+        time.sleep(self._head_latency)
+        return super()._head(*args, **kwargs)
+
+
+def _make_suppliers(count):
+    rng = random.Random(1234)
+    alphabet = string.ascii_letters + "    &.,'-_()" + "".join(BAD_SUPPLIER_NAME_CHARACTERS) + "éü"
+    return [
+        {"supplierId": 500000 + i, "supplierName": "".join(rng.choice(alphabet) for _ in range(rng.randint(5, 60)))}
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--suppliers", type=int, default=20000)
+    parser.add_argument("--number", type=int, default=5)
+    parser.add_argument("--signed-suppliers", type=int, default=1000)
+    parser.add_argument("--head-latency", type=float, default=10)
+    parser.add_argument("--max-workers", type=int, default=16)
+    args = parser.parse_args()
+
+    suppliers = _make_suppliers(args.suppliers)
+    assert _per_supplier_plan(suppliers) == _bulk_plan(suppliers)
+
+    per_supplier_time = min(timeit.repeat(lambda: _per_supplier_plan(suppliers), number=1, repeat=args.number))
+    bulk_time = min(timeit.repeat(lambda: _bulk_plan(suppliers), number=1, repeat=args.number))
+    print(f"{args.suppliers} suppliers, paths and download filenames:")
+    print(f"  per-supplier calls       {per_supplier_time * 1000:>9.1f}ms")
+    print(f"  plan_supplier_documents  {bulk_time * 1000:>9.1f}ms ({per_supplier_time / bulk_time:.1f}x)")
+
+    signed_suppliers = suppliers[:args.signed_suppliers]
+    with tempfile.TemporaryDirectory() as root:
+        bucket = _RemoteLocalS3("digitalmarketplace-documents-dev-dev", root, head_latency=0)
+        for path, _ in _bulk_plan(signed_suppliers):
+            bucket.save(path, BytesIO(b"%PDF"))
+        bucket._head_latency = args.head_latency / 1000
+
+        print(f"{len(signed_suppliers)} suppliers with signed URLs, {args.head_latency}ms per HEAD request:")
+        for max_workers in (None, args.max_workers):
+            signing_time = timeit.timeit(
+                lambda: _bulk_plan(signed_suppliers, bucket=bucket, max_workers=max_workers), number=1,
+            )
+            print(f"  max_workers={max_workers!s:<13} {signing_time * 1000:>9.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
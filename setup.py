@@ -37,7 +37,6 @@ setup(
          'mailchimp3==3.0.17',
          'requests>=2.22.0,<3',
          'redis>=3.5.2',
-         'fleep<1.1,>=1.0.1',
          'notifications-python-client>=5.7.1,<9.0.0',
          'odfpy>=1.3.6',
          'python-json-logger>=0.1.11,<3.0.0',
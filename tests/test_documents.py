@@ -1,11 +1,19 @@
 # coding: utf-8
+import io
+import logging
+import threading
+import zipfile
 from unittest import mock
 import pytest
 
 from botocore.exceptions import ClientError
+import flask
 from freezegun import freeze_time
+from hypothesis import given, strategies as st
 
+from dmutils.s3 import S3, SignedURLCache
 from dmutils.documents import (
+    DocumentValidationError, ValidatingDocumentStream,
     generate_file_name, get_extension,
     file_is_not_empty, file_is_empty, filter_empty_files,
     file_is_less_than_5mb,
@@ -14,8 +22,9 @@ from dmutils.documents import (
     upload_document, upload_service_documents, upload_declaration_documents,
     get_signed_url, get_agreement_document_path, get_document_path,
     sanitise_supplier_name, file_is_pdf, file_is_zip, file_is_image,
-    file_is_csv, generate_timestamped_document_upload_path,
-    degenerate_document_path_and_return_doc_name, generate_download_filename)
+    file_is_csv, generate_timestamped_document_upload_path, get_possible_extensions_from_header,
+    degenerate_document_path_and_return_doc_name, generate_download_filename,
+    BAD_SUPPLIER_NAME_CHARACTERS, PlannedDocument, plan_supplier_documents)
 
 from helpers import MockFile
 
@@ -123,6 +132,76 @@ class TestValidateDocuments:
         # Check an image file with invalid extension
         assert file_is_csv(MockFile(open('tests/test_files/test_image.jpg', 'rb').read(), 'file1.jpg')) is False
 
+    @pytest.mark.parametrize("contents", (
+        b"GIF89a\x01\x00\x01\x00\x00\xff\x00",
+        b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + b"\x00" * 100,
+        b"{\\rtf1\\ansi a,b,c",
+        b"ID3\x04\x00\x00\x00\x00\x00\x00",
+        b"RIFF$\x08\x00\x00WAVEfmt ",
+        b"\x00\x00\x01\xba\x44\x00\x04\x00\x04\x01",
+        b"OggS\x00\x02\x00\x00\x00\x00",
+        b"\x1aE\xdf\xa3\x9fB\x86\x81\x01",
+        b"\x00\x00\x00\x20ftypisom\x00\x00\x02\x00",
+        b"\x00\x00\x00\x14ftypqt  \x20\x05\x03\x00",
+        b'<?xml version="1.0"?><a>1,2</a>',
+    ))
+    def test_file_is_csv_rejects_other_known_formats(self, contents):
+        assert file_is_csv(MockFile(contents, 'file1.csv')) is False
+
+    @pytest.mark.parametrize("contents", (
+        b"ID,name\n3,RIFF",
+        b"type,xml\n1,2",
+        b"name,ftype\n1,2",
+    ))
+    def test_file_is_csv_accepts_text_resembling_a_signature(self, contents):
+        assert file_is_csv(MockFile(contents, 'file1.csv')) is True
+
+    @pytest.mark.parametrize("encoding", ("utf-16", "utf-16-le", "utf-8-sig"))
+    def test_file_is_csv_accepts_other_encodings(self, encoding):
+        assert file_is_csv(MockFile("a,b\n1,2\n".encode(encoding), 'file1.csv')) is True
+
+    @pytest.mark.parametrize('file_name, expected', (
+        ('test_image.jpeg', ['jpg']),
+        ('test_image.jpg', ['jpg']),
+        ('test_image.png', ['png']),
+        ('test_pdf.pdf', ['pdf']),
+        ('test_zip.zip', ['zip']),
+        ('test_odt.odt', ['odt', 'zip']),
+        ('test_ods.ods', ['ods', 'zip']),
+        ('test_odp.odp', ['odp', 'zip']),
+    ))
+    def test_get_possible_extensions_from_header(self, file_name, expected):
+        with open('tests/test_files/' + file_name, 'rb') as f:
+            assert get_possible_extensions_from_header(f.read(128)) == expected
+
+    @pytest.mark.parametrize('header', (b'', b'a,b,c,d\n1,2,3,4', b'PK', b'%PD'))
+    def test_get_possible_extensions_from_header_unrecognised(self, header):
+        assert get_possible_extensions_from_header(header) == []
+
+    @staticmethod
+    def _zip_header(name, contents, compress_type=zipfile.ZIP_STORED):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zip_file:
+            zip_file.writestr(zipfile.ZipInfo(name), contents, compress_type=compress_type)
+        return buffer.getvalue()[:128]
+
+    @pytest.mark.parametrize('name, contents, compress_type', (
+        # not an OpenDocument mimetype
+        ('mimetype', 'application/zip', zipfile.ZIP_STORED),
+        # only a prefix of one
+        ('mimetype', 'application/vnd.oasis.opendocument.tex', zipfile.ZIP_STORED),
+        # OpenDocument requires the mimetype entry to be first and uncompressed
+        ('mimetype', 'application/vnd.oasis.opendocument.text', zipfile.ZIP_DEFLATED),
+        ('content.xml', 'application/vnd.oasis.opendocument.text', zipfile.ZIP_STORED),
+    ))
+    def test_get_possible_extensions_from_header_checks_odf_mimetype(self, name, contents, compress_type):
+        assert get_possible_extensions_from_header(self._zip_header(name, contents, compress_type)) == ['zip']
+
+    def test_get_possible_extensions_from_header_odf_mimetype(self):
+        assert get_possible_extensions_from_header(
+            self._zip_header('mimetype', 'application/vnd.oasis.opendocument.spreadsheet')
+        ) == ['ods', 'zip']
+
     def test_validate_documents(self):
         assert validate_documents(
             {'file1': MockFile(open('tests/test_files/test_pdf.pdf', 'rb').read(), 'test_pdf.pdf')}
@@ -244,6 +323,27 @@ class TestUploadDocument:
             acl='public-read'
         )
 
+    def test_document_upload_deduplicate(self):
+        uploader = mock.Mock()
+        uploader.save.return_value = {"path": "g-cloud-6/documents/5/123-pricing-document-2014-12-25-1200.pdf"}
+        with freeze_time('2015-01-02 04:05:00'):
+            assert upload_document(
+                uploader,
+                'documents',
+                'http://assets',
+                {'id': "123", 'supplierId': 5, 'frameworkSlug': 'g-cloud-6'},
+                "pricingDocumentURL",
+                MockFile(b"*", 'file.pdf'),
+                deduplicate=True,
+            ) == 'http://assets/g-cloud-6/documents/5/123-pricing-document-2014-12-25-1200.pdf'
+
+        uploader.save.assert_called_once_with(
+            'g-cloud-6/documents/5/123-pricing-document-2015-01-02-0405.pdf',
+            mock.ANY,
+            acl='public-read',
+            dedupe_prefix='g-cloud-6/documents/5/123-pricing-document-',
+        )
+
     def test_document_upload_with_invalid_upload_type(self):
         uploader = mock.Mock()
         with pytest.raises(ValueError):
@@ -334,6 +434,195 @@ class TestUploadServiceDocuments:
         assert files is None
         assert 'pricingDocumentURL' in errors
 
+    def test_upload_single_pass(self):
+        request_files = {'pricingDocumentURL': self.test_pdf}
+        self.uploader.save.side_effect = lambda path, file_, **kwargs: file_.read()
+
+        with freeze_time('2015-10-04 14:36:05'):
+            files, errors = upload_service_documents(
+                self.uploader, 'documents', self.documents_url, self.service,
+                request_files, self.section, single_pass=True)
+
+        assert files == {
+            'pricingDocumentURL':
+                'http://localhost/g-cloud-7/documents/12345/654321-pricing-document-2015-10-04-1436.pdf',
+        }
+        assert errors == {}
+        stream = self.uploader.save.call_args[0][1]
+        assert isinstance(stream, ValidatingDocumentStream)
+
+    def test_single_pass_empty_files_are_filtered(self):
+        request_files = {'pricingDocumentURL': MockFile(b"", 'q1.pdf')}
+
+        files, errors = upload_service_documents(
+            self.uploader, 'documents', self.documents_url, self.service,
+            request_files, self.section, single_pass=True)
+
+        assert files == {}
+        assert errors == {}
+        assert self.uploader.save.called is False
+
+    def test_single_pass_format_errors_prevent_upload(self):
+        request_files = {'pricingDocumentURL': MockFile(b"*" * 100, 'q1.pdf')}
+
+        files, errors = upload_service_documents(
+            self.uploader, 'documents', self.documents_url, self.service,
+            request_files, self.section, single_pass=True)
+
+        assert files is None
+        assert errors == {'pricingDocumentURL': 'file_is_open_document_format'}
+        assert self.uploader.save.called is False
+
+    @pytest.mark.usefixtures("s3_mock")
+    def test_single_pass_size_limit_aborts_upload(self, empty_bucket):
+        request_files = {
+            'pricingDocumentURL': MockFile(self.test_pdf.getvalue() + b"*" * 5400000, 'q1.pdf'),
+        }
+
+        files, errors = upload_service_documents(
+            S3("dear-liza"), 'documents', self.documents_url, self.service,
+            request_files, self.section, single_pass=True)
+
+        assert files is None
+        assert errors == {'pricingDocumentURL': 'file_is_less_than_5mb'}
+        assert list(empty_bucket.objects.all()) == []
+
+    def test_upload_concurrently(self):
+        self.section.get_question_ids.return_value = [
+            'pricingDocumentURL', 'serviceDefinitionDocumentURL', 'termsAndConditionsDocumentURL',
+        ]
+        request_files = {
+            field: MockFile(self.test_pdf.getvalue(), 'test_pdf.pdf')
+            for field in self.section.get_question_ids.return_value
+        }
+        # each upload waits for the others to start, so would time out if done one after another
+        barrier = threading.Barrier(3, timeout=5)
+        self.uploader.save.side_effect = lambda *args, **kwargs: barrier.wait()
+
+        with freeze_time('2015-10-04 14:36:05'):
+            files, errors = upload_service_documents(
+                self.uploader, 'documents', self.documents_url, self.service,
+                request_files, self.section, max_workers=4)
+
+        assert files == {
+            'pricingDocumentURL':
+                'http://localhost/g-cloud-7/documents/12345/654321-pricing-document-2015-10-04-1436.pdf',
+            'serviceDefinitionDocumentURL':
+                'http://localhost/g-cloud-7/documents/12345/654321-service-definition-document-2015-10-04-1436.pdf',
+            'termsAndConditionsDocumentURL':
+                'http://localhost/g-cloud-7/documents/12345/654321-terms-and-conditions-2015-10-04-1436.pdf',
+        }
+        assert errors == {}
+
+    @pytest.mark.usefixtures("s3_mock")
+    @pytest.mark.parametrize("max_workers", (None, 4))
+    def test_uploads_logged_as_part_of_request(self, app, empty_bucket, max_workers):
+        self.section.get_question_ids.return_value = ['pricingDocumentURL', 'serviceDefinitionDocumentURL']
+        request_files = {
+            field: MockFile(self.test_pdf.getvalue(), 'test_pdf.pdf')
+            for field in self.section.get_question_ids.return_value
+        }
+
+        with app.test_request_context("/"):
+            flask.request.is_sampled = True
+            with mock.patch.object(logging.getLogger("dmutils.timing"), "log") as log:
+                files, errors = upload_service_documents(
+                    S3("dear-liza"), 'documents', self.documents_url, self.service,
+                    request_files, self.section, max_workers=max_workers)
+
+        assert errors == {}
+        assert sorted(
+            call[1]["extra"]["filepath"]
+            for call in log.call_args_list
+            if call[0][1] == "Call to S3 (file upload [{filepath} of size {filesize} and acl {fileacl}]) executed in "
+                             "{duration_real}s"
+        ) == sorted(path.replace(self.documents_url + "/", "") for path in files.values())
+
+    def test_upload_concurrently_with_failures(self):
+        self.section.get_question_ids.return_value = ['pricingDocumentURL', 'serviceDefinitionDocumentURL']
+        request_files = {
+            field: MockFile(self.test_pdf.getvalue(), 'test_pdf.pdf')
+            for field in self.section.get_question_ids.return_value
+        }
+
+        def save(path, *args, **kwargs):
+            if "service-definition" in path:
+                raise ClientError({"Error": {"Code": "500"}}, "PutObject")
+
+        self.uploader.save.side_effect = save
+
+        files, errors = upload_service_documents(
+            self.uploader, 'documents', self.documents_url, self.service,
+            request_files, self.section, max_workers=2)
+
+        assert list(files) == ['pricingDocumentURL', 'serviceDefinitionDocumentURL']
+        assert files['pricingDocumentURL'].startswith('http://localhost/g-cloud-7/documents/12345/654321-pricing')
+        assert errors == {'serviceDefinitionDocumentURL': 'file_can_be_saved'}
+
+
+class TestValidatingDocumentStream:
+    def setup(self):
+        self.test_pdf_contents = open('tests/test_files/test_pdf.pdf', 'rb').read()
+
+    def test_reads_contents(self):
+        stream = ValidatingDocumentStream(MockFile(self.test_pdf_contents, 'test.pdf'))
+
+        assert stream.filename == 'test.pdf'
+        assert stream.is_empty is False
+        assert stream.read() == self.test_pdf_contents
+
+    def test_reads_underlying_file_once(self):
+        file_ = MockFile(self.test_pdf_contents, 'test.pdf')
+        bytes_read = []
+        original_read = file_.read
+
+        def _read(*args):
+            data = original_read(*args)
+            bytes_read.append(len(data))
+            return data
+
+        with mock.patch.object(file_, "read", side_effect=_read):
+            stream = ValidatingDocumentStream(file_)
+            while stream.read(100):
+                pass
+
+        assert sum(bytes_read) == len(self.test_pdf_contents)
+        assert stream.tell() == len(self.test_pdf_contents)
+
+    def test_seeking(self):
+        stream = ValidatingDocumentStream(MockFile(self.test_pdf_contents, 'test.pdf'))
+
+        assert stream.seek(0, 2) == len(self.test_pdf_contents)
+        stream.seek(0)
+        assert stream.read(10) == self.test_pdf_contents[:10]
+        stream.seek(0)
+        assert stream.read() == self.test_pdf_contents
+
+    def test_empty(self):
+        stream = ValidatingDocumentStream(MockFile(b"", 'test.pdf'))
+
+        assert stream.is_empty is True
+        assert stream.read() == b""
+
+    @pytest.mark.parametrize("contents,filename", (
+        (b"*" * 100, "test.pdf"),
+        (b"%PDF-1.4 " * 100, "test.doc"),
+    ))
+    def test_invalid_format(self, contents, filename):
+        with pytest.raises(DocumentValidationError) as e:
+            ValidatingDocumentStream(MockFile(contents, filename))
+
+        assert e.value.validator == "file_is_open_document_format"
+
+    def test_size_limit(self):
+        stream = ValidatingDocumentStream(MockFile(self.test_pdf_contents, 'test.pdf'), max_size=1000)
+
+        assert len(stream.read(999)) == 999
+        with pytest.raises(DocumentValidationError) as e:
+            stream.read(1)
+
+        assert e.value.validator == "file_is_less_than_5mb"
+
 
 class TestUploadDeclarationDocuments:
     def setup(self):
@@ -431,6 +720,53 @@ def test_get_signed_url(base_url, expected):
     assert url == expected
 
 
+class TestGetSignedUrlWithCache:
+    def setup(self):
+        self.bucket = mock.Mock(bucket_name="dear-liza")
+        self.bucket.get_signed_url.return_value = "http://example/foo?after"
+        self.cache = SignedURLCache(safety_margin=10)
+
+    def test_reuses_url_while_valid(self):
+        with freeze_time('2021-01-01 12:00:00') as frozen_time:
+            assert get_signed_url(self.bucket, 'foo', 'https://other', signed_url_cache=self.cache) == \
+                'https://other/foo?after'
+            frozen_time.tick(19)
+            assert get_signed_url(self.bucket, 'foo', 'https://other', signed_url_cache=self.cache) == \
+                'https://other/foo?after'
+
+        assert self.bucket.get_signed_url.call_args_list == [mock.call('foo', expires_in=30)]
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_resigns_within_safety_margin_of_expiry(self):
+        with freeze_time('2021-01-01 12:00:00') as frozen_time:
+            get_signed_url(self.bucket, 'foo', None, signed_url_cache=self.cache)
+            frozen_time.tick(21)
+            get_signed_url(self.bucket, 'foo', None, signed_url_cache=self.cache)
+
+        assert self.bucket.get_signed_url.call_count == 2
+        assert (self.cache.hits, self.cache.misses) == (0, 2)
+
+    @pytest.mark.parametrize('other_args', (
+        ('bar', None, 30),
+        ('foo', 'https://other', 30),
+        ('foo', None, 60),
+    ))
+    def test_cache_key_components(self, other_args):
+        path, base_url, expires_in = other_args
+        get_signed_url(self.bucket, 'foo', None, signed_url_cache=self.cache)
+        get_signed_url(self.bucket, path, base_url, expires_in=expires_in, signed_url_cache=self.cache)
+
+        assert self.bucket.get_signed_url.call_count == 2
+
+    def test_missing_documents_not_cached(self):
+        self.bucket.get_signed_url.return_value = None
+        assert get_signed_url(self.bucket, 'foo', None, signed_url_cache=self.cache) is None
+        assert get_signed_url(self.bucket, 'foo', None, signed_url_cache=self.cache) is None
+
+        assert self.bucket.get_signed_url.call_count == 2
+        assert len(self.cache) == 0
+
+
 def test_get_agreement_document_path():
     assert get_agreement_document_path('g-cloud-7', 1234, 'foo.pdf') == \
         'g-cloud-7/agreements/1234/1234-foo.pdf'
@@ -469,5 +805,90 @@ def test_sanitise_supplier_name():
     assert sanitise_supplier_name(u"Ψ is a silly character") == "is_a_silly_character"
 
 
+def _replace_based_sanitise_supplier_name(supplier_name):
+    sanitised_supplier_name = supplier_name.encode("ascii", errors="ignore").decode("ascii").strip()
+    sanitised_supplier_name = sanitised_supplier_name.replace(' ', '_').replace('&', 'and')
+    for bad_char in BAD_SUPPLIER_NAME_CHARACTERS:
+        sanitised_supplier_name = sanitised_supplier_name.replace(bad_char, '')
+    while '__' in sanitised_supplier_name:
+        sanitised_supplier_name = sanitised_supplier_name.replace('__', '_')
+    return sanitised_supplier_name
+
+
+@given(st.text(alphabet=st.sampled_from(BAD_SUPPLIER_NAME_CHARACTERS + [' ', '_', '\t', 'a', '9', 'Ψ'])) | st.text())
+def test_sanitise_supplier_name_matches_replace_based_implementation(supplier_name):
+    assert sanitise_supplier_name(supplier_name) == _replace_based_sanitise_supplier_name(supplier_name)
+
+
 def test_generate_download_filename():
     assert generate_download_filename(584425, 'result-letter.pdf', 'ICNT_Consulting_Ltd') == 'ICNT_Consulting_Ltd-584425-result-letter.pdf'   # noqa
+
+
+class TestPlanSupplierDocuments:
+    suppliers = (
+        {"supplierId": 584425, "supplierName": "ICNT Consulting Ltd."},
+        {"supplierId": 123, "supplierName": "Kev & Sons"},
+    )
+
+    def test_paths_and_download_filenames(self):
+        planned_documents = plan_supplier_documents(
+            'g-cloud-12', iter(self.suppliers), 'documents', 'result-letter.pdf',
+        )
+
+        assert list(planned_documents) == [
+            PlannedDocument(
+                584425,
+                get_document_path('g-cloud-12', 584425, 'documents', 'result-letter.pdf'),
+                generate_download_filename(584425, 'result-letter.pdf', 'ICNT Consulting Ltd.'),
+            ),
+            PlannedDocument(
+                123,
+                'g-cloud-12/documents/123/123-result-letter.pdf',
+                'Kev_and_Sons-123-result-letter.pdf',
+            ),
+        ]
+
+    def test_timestamped_paths(self):
+        with freeze_time('2015-01-02 03:04:05'):
+            planned_documents = list(
+                plan_supplier_documents('g-cloud-12', self.suppliers, 'agreements', 'a-thing.pdf', timestamped=True)
+            )
+
+        assert [planned_document.path for planned_document in planned_documents] == [
+            'g-cloud-12/agreements/584425/584425-a-thing-2015-01-02-030405.pdf',
+            'g-cloud-12/agreements/123/123-a-thing-2015-01-02-030405.pdf',
+        ]
+        assert planned_documents[1].download_filename == 'Kev_and_Sons-123-a-thing.pdf'
+
+    @pytest.mark.parametrize('max_workers', (None, 4))
+    def test_signed_urls(self, max_workers):
+        bucket = mock.Mock(bucket_name="dear-liza")
+        bucket.get_signed_url.side_effect = lambda path, expires_in: (
+            None if "123" in path else f"http://example/{path}?after"
+        )
+
+        planned_documents = plan_supplier_documents(
+            'g-cloud-12', self.suppliers, 'documents', 'result-letter.pdf',
+            bucket=bucket, base_url='https://other', expires_in=60, max_workers=max_workers,
+        )
+
+        assert [planned_document.signed_url for planned_document in planned_documents] == [
+            'https://other/g-cloud-12/documents/584425/584425-result-letter.pdf?after',
+            None,
+        ]
+        assert sorted(bucket.get_signed_url.call_args_list) == [
+            mock.call('g-cloud-12/documents/123/123-result-letter.pdf', expires_in=60),
+            mock.call('g-cloud-12/documents/584425/584425-result-letter.pdf', expires_in=60),
+        ]
+
+    def test_signed_urls_use_cache(self):
+        bucket = mock.Mock(bucket_name="dear-liza")
+        bucket.get_signed_url.return_value = "http://example/foo?after"
+        cache = SignedURLCache()
+
+        for _ in range(2):
+            list(plan_supplier_documents(
+                'g-cloud-12', self.suppliers, 'documents', 'result-letter.pdf', bucket=bucket, signed_url_cache=cache,
+            ))
+
+        assert bucket.get_signed_url.call_count == 2
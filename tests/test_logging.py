@@ -1,8 +1,12 @@
 from io import StringIO
 import json
 import logging
+import os
 import os.path
+import queue
+import signal
 import tempfile
+import threading
 import time
 
 from unittest import mock
@@ -14,13 +18,15 @@ from dmtestutils.comparisons import AnyStringMatching, AnySupersetOf, Restricted
 
 from dmutils.logging import init_app, JSONFormatter, CustomLogFormatter, configure_handler
 from dmutils.logging import (LOG_FORMAT, get_json_log_format, AppNameFilter, RequestExtraContextFilter,
-                             AppStackLocationFilter, AppInstanceFilter)
+                             AppStackLocationFilter, AppInstanceFilter, DMQueueHandler, EnrichmentFilter,
+                             get_enrichment_filter)
 
 
 def test_configure_handler(app):
     handler = mock.Mock()
     configure_handler(handler, app, mock.Mock())
-    filter_classes = [x[0][0].__class__ for x in handler.addFilter.call_args_list]
+    assert [x[0][0].__class__ for x in handler.addFilter.call_args_list] == [EnrichmentFilter]
+    filter_classes = [filter_.__class__ for filter_ in handler.addFilter.call_args[0][0].filters]
     assert filter_classes == [
         AppNameFilter,
         RequestExtraContextFilter,
@@ -32,7 +38,7 @@ def test_configure_handler_has_instance_index_where_present(app, os_environ):
     os_environ.update({'CF_INSTANCE_INDEX': '1'})
     handler = mock.Mock()
     configure_handler(handler, app, mock.Mock())
-    filter_classes = [x[0][0].__class__ for x in handler.addFilter.call_args_list]
+    filter_classes = [filter_.__class__ for filter_ in handler.addFilter.call_args[0][0].filters]
     assert filter_classes == [
         AppNameFilter,
         RequestExtraContextFilter,
@@ -41,6 +47,61 @@ def test_configure_handler_has_instance_index_where_present(app, os_environ):
     ]
 
 
+def test_configure_handler_with_enrichment_filter(app):
+    handler = mock.Mock()
+    enrichment_filter = get_enrichment_filter(app)
+    configure_handler(handler, app, mock.Mock(), enrichment_filter=enrichment_filter)
+    assert handler.addFilter.call_args_list == [mock.call(enrichment_filter)]
+
+
+class TestAppStackLocationFilter:
+    @staticmethod
+    def _frame(filename):
+        return mock.Mock(f_code=mock.Mock(co_filename=filename))
+
+    def test_is_interesting_frame(self):
+        filter_ = AppStackLocationFilter("app_", "/srv/app")
+
+        assert filter_.is_interesting_frame(self._frame("/srv/app/views.py")) is True
+        assert filter_.is_interesting_frame(self._frame("/srv/app/main/views/suppliers.py")) is True
+        assert filter_.is_interesting_frame(self._frame("/srv/application.py")) is False
+        assert filter_.is_interesting_frame(self._frame("/srv/venv/lib/flask/app.py")) is False
+        assert filter_.is_interesting_frame(self._frame("<template>")) is False
+
+    def test_is_interesting_frame_memoized_by_filename(self):
+        filter_ = AppStackLocationFilter("app_", "/srv/app")
+
+        with mock.patch("dmutils.logging.os.path.commonpath", side_effect=os.path.commonpath) as commonpath:
+            for _ in range(3):
+                assert filter_.is_interesting_frame(self._frame("/srv/app/views.py")) is True
+                assert filter_.is_interesting_frame(self._frame("/srv/venv/lib/flask/app.py")) is False
+
+        assert commonpath.call_count == 2
+
+
+class TestEnrichmentFilter:
+    def test_applies_filters_once_per_record(self):
+        filters = [mock.Mock(), mock.Mock()]
+        enrichment_filter = EnrichmentFilter(filters)
+        records = [logging.makeLogRecord({"msg": "hello"}), logging.makeLogRecord({"msg": "again"})]
+
+        for record in records + records:
+            assert enrichment_filter.filter(record) is record
+
+        for filter_ in filters:
+            assert filter_.filter.call_args_list == [mock.call(record) for record in records]
+
+    def test_records_enriched_by_each_filter(self):
+        first_filter, second_filter = mock.Mock(), mock.Mock()
+        record = logging.makeLogRecord({"msg": "hello"})
+
+        EnrichmentFilter([first_filter]).filter(record)
+        EnrichmentFilter([second_filter]).filter(record)
+
+        assert first_filter.filter.call_args_list == [mock.call(record)]
+        assert second_filter.filter.call_args_list == [mock.call(record)]
+
+
 def test_request_extra_context_filter_not_in_app_context():
     # using spec_set to ensure no attribute-setting is attempted on this "record"
     result = RequestExtraContextFilter().filter(mock.Mock(spec_set=[]))
@@ -98,6 +159,32 @@ def test_init_app_adds_file_handler_with_log_path_and_stream_handler(app):
         assert isinstance(app.logger.handlers[0], logging.StreamHandler)
         assert isinstance(app.logger.handlers[1], logging.FileHandler)
         assert all(isinstance(handler.formatter, JSONFormatter) for handler in app.logger.handlers)
+        assert app.logger.handlers[0].filters == app.logger.handlers[1].filters
+
+
+def test_records_enriched_and_formatted_once_with_log_path_and_stream_handler(app):
+    stream = StringIO()
+    with tempfile.NamedTemporaryFile() as f:
+        app.config['DM_LOG_PATH'] = f.name
+        # (patching StreamHandler, as elsewhere, would also affect its FileHandler subclass)
+        with mock.patch('sys.stdout', stream):
+            init_app(app)
+
+        with mock.patch.object(
+            AppStackLocationFilter, "_findCaller", autospec=True, side_effect=AppStackLocationFilter._findCaller,
+        ) as find_caller, mock.patch.object(
+            JSONFormatter, "format_record", autospec=True, side_effect=JSONFormatter.format_record,
+        ) as format_record:
+            app.logger.warning("hello {foo}", extra={"foo": "bar"})
+
+        with open(f.name) as log_file:
+            file_lines = log_file.read().splitlines()
+
+    assert find_caller.call_count == 1
+    assert format_record.call_count == 1
+    assert json.loads(file_lines[-1])["message"] == "hello bar"
+    assert stream.getvalue().splitlines()[-1] == file_lines[-1]
+    assert "_dm_formatted" not in file_lines[-1]
 
 
 def test_init_app_adds_stream_handler_with_plain_text_format_when_config_env_set(app):
@@ -138,6 +225,230 @@ def test_urllib3_retry_logger_not_configured_for_search_api(app):
     assert 'urllib3.util.retry' not in loggers
 
 
+class TestInitAppWithLogQueue:
+    def test_adds_queue_handler(self, app):
+        app.config['DM_LOG_QUEUE'] = True
+        init_app(app)
+
+        try:
+            assert len(app.logger.handlers) == 1
+            queue_handler = app.logger.handlers[0]
+            assert isinstance(queue_handler, DMQueueHandler)
+            assert [filter_.__class__ for filter_ in queue_handler.filters[0].filters] == [
+                AppNameFilter,
+                RequestExtraContextFilter,
+                AppStackLocationFilter,
+            ]
+            assert len(queue_handler.handlers) == 1
+            assert isinstance(queue_handler.handlers[0], logging.StreamHandler)
+            assert isinstance(queue_handler.handlers[0].formatter, JSONFormatter)
+            assert queue_handler.handlers[0].filters == []
+        finally:
+            app.logger.handlers[0].stop()
+
+    def test_reinitialising_stops_previous_queue(self, app):
+        app.config['DM_LOG_QUEUE'] = True
+        init_app(app)
+        previous_queue_handler = app.logger.handlers[0]
+        init_app(app)
+
+        try:
+            assert previous_queue_handler._listener._thread is None
+            assert app.logger.handlers[0] is not previous_queue_handler
+        finally:
+            app.logger.handlers[0].stop()
+
+    def test_records_filtered_by_logging_thread_and_formatted_by_listener(self, app):
+        stream = StringIO()
+        app.config['DM_LOG_QUEUE'] = True
+        with mock.patch('dmutils.logging.logging.StreamHandler', return_value=logging.StreamHandler(stream)):
+            init_app(app)
+        queue_handler = app.logger.handlers[0]
+        formatting_threads = []
+        queue_handler.handlers[0].formatter.format = mock.Mock(
+            side_effect=lambda record: formatting_threads.append(threading.current_thread()) or record.getMessage(),
+        )
+
+        with app.test_request_context('/'):
+            request.get_extra_log_context = mock.Mock(spec_set=[], return_value={"ankles": "thinsocked"})
+            app.logger.warning("Charming day %s", "ample")
+        queue_handler.stop()
+
+        assert stream.getvalue().endswith("Charming day ample\n")
+        assert formatting_threads and threading.current_thread() not in formatting_threads
+        record = queue_handler.handlers[0].formatter.format.call_args_list[-1][0][0]
+        assert record.ankles == "thinsocked"
+        assert record.app_funcName == "test_records_filtered_by_logging_thread_and_formatted_by_listener"
+
+    def test_json_output_unchanged(self, app):
+        stream = StringIO()
+        app.config['DM_LOG_QUEUE'] = True
+        with mock.patch('dmutils.logging.logging.StreamHandler', return_value=logging.StreamHandler(stream)):
+            init_app(app)
+
+        app.logger.info("Charming day {underleaves}", extra={"underleaves": "ample"})
+        app.logger.handlers[0].stop()
+
+        assert json.loads(stream.getvalue().splitlines()[-1]) == AnySupersetOf({
+            "message": "Charming day ample",
+            "underleaves": "ample",
+            "application": "none",
+            "requestId": None,
+        })
+
+
+class _BlockingHandler(logging.Handler):
+    """Handler which records what it's given, but waits for ``unblock`` to be set before returning"""
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.entered = threading.Event()
+        self.unblock = threading.Event()
+
+    def emit(self, record):
+        self.entered.set()
+        self.unblock.wait(5)
+        self.records.append(record.getMessage())
+
+
+class TestDMQueueHandler:
+    def _queue_handler(self, overflow, maxsize=2):
+        handler = _BlockingHandler()
+        queue_handler = DMQueueHandler(queue.Queue(maxsize), [handler], overflow=overflow)
+        queue_handler.start()
+
+        # leave the listener stuck handling the first record, so we control when the queue has space
+        queue_handler.handle(logging.makeLogRecord({"msg": "first", "levelno": logging.INFO, "levelname": "INFO"}))
+        assert handler.entered.wait(5)
+
+        return queue_handler, handler
+
+    @staticmethod
+    def _log(queue_handler, msg, levelno=logging.INFO):
+        queue_handler.handle(logging.makeLogRecord(
+            {"msg": msg, "levelno": levelno, "levelname": logging.getLevelName(levelno)}
+        ))
+
+    def test_unknown_overflow_policy(self):
+        with pytest.raises(ValueError):
+            DMQueueHandler(queue.Queue(), [], overflow="drop-everything")
+
+    def test_block(self):
+        queue_handler, handler = self._queue_handler("block")
+        self._log(queue_handler, "second")
+        self._log(queue_handler, "third")
+
+        blocked_thread = threading.Thread(target=self._log, args=(queue_handler, "fourth", logging.DEBUG))
+        blocked_thread.start()
+        blocked_thread.join(0.1)
+        assert blocked_thread.is_alive()
+
+        handler.unblock.set()
+        blocked_thread.join(5)
+        queue_handler.stop()
+
+        assert handler.records == ["first", "second", "third", "fourth"]
+        assert queue_handler.dropped == {}
+
+    def test_drop_debug(self):
+        queue_handler, handler = self._queue_handler("drop-debug")
+        self._log(queue_handler, "second", logging.DEBUG)
+        self._log(queue_handler, "third")
+        self._log(queue_handler, "fourth", logging.DEBUG)
+
+        blocked_thread = threading.Thread(target=self._log, args=(queue_handler, "fifth"))
+        blocked_thread.start()
+        blocked_thread.join(0.1)
+        assert blocked_thread.is_alive()
+
+        handler.unblock.set()
+        blocked_thread.join(5)
+        queue_handler.stop()
+
+        assert handler.records[:4] == ["first", "second", "third", "fifth"]
+        assert queue_handler.dropped == {"DEBUG": 1}
+
+    def test_drop_oldest(self):
+        queue_handler, handler = self._queue_handler("drop-oldest")
+        for msg, levelno in (
+            ("second", logging.WARNING), ("third", logging.INFO), ("fourth", logging.INFO), ("fifth", logging.DEBUG),
+        ):
+            self._log(queue_handler, msg, levelno)
+
+        handler.unblock.set()
+        queue_handler.stop()
+
+        assert handler.records[:3] == ["first", "fourth", "fifth"]
+        assert queue_handler.dropped == {"WARNING": 1, "INFO": 1}
+
+    def test_stop_reports_dropped_records(self):
+        queue_handler, handler = self._queue_handler("drop-oldest", maxsize=1)
+        self._log(queue_handler, "second")
+        self._log(queue_handler, "third")
+
+        handler.unblock.set()
+        queue_handler.stop()
+
+        assert handler.records == ["first", "third", "Dropped {dropped_log_records} log records from full log queue"]
+
+    def test_logging_after_stop_is_handled_directly(self):
+        queue_handler, handler = self._queue_handler("block")
+        handler.unblock.set()
+        queue_handler.stop()
+        queue_handler.stop()
+
+        self._log(queue_handler, "second")
+
+        assert handler.records == ["first", "second"]
+
+    @pytest.mark.skipif(not hasattr(os, "register_at_fork"), reason="needs os.register_at_fork")
+    def test_listener_restarted_in_forked_child(self):
+        queue_handler, handler = self._queue_handler("block", maxsize=1)
+        self._log(queue_handler, "second")
+        read_fd, write_fd = os.pipe()
+
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                # don't wait forever if the child's logging blocks
+                signal.alarm(10)
+                os.close(read_fd)
+                handler.unblock = threading.Event()
+                handler.unblock.set()
+
+                # the parent's queue is full, so without a new listener these would wait forever for space
+                self._log(queue_handler, "from child")
+                self._log(queue_handler, "also from child")
+                queue_handler.stop()
+
+                os.write(write_fd, json.dumps(handler.records).encode())
+                exit_code = 0
+            finally:
+                os._exit(exit_code)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd, "rb") as child_output:
+            child_records = child_output.read()
+        _, status = os.waitpid(pid, 0)
+
+        handler.unblock.set()
+        queue_handler.stop()
+
+        assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+        assert json.loads(child_records) == ["from child", "also from child"]
+        assert handler.records == ["first", "second"]
+
+    def test_stop_is_registered_to_run_at_exit(self):
+        with mock.patch("dmutils.logging.atexit") as atexit:
+            queue_handler = DMQueueHandler(queue.Queue(), [])
+            queue_handler.start()
+            assert atexit.register.call_args_list == [mock.call(queue_handler.stop)]
+
+            queue_handler.stop()
+            assert atexit.unregister.call_args_list == [mock.call(queue_handler.stop)]
+
+
 def _set_request_class_is_sampled(app, sampled):
     class _Request(app.request_class):
         is_sampled = sampled
@@ -0,0 +1,151 @@
+from io import BytesIO
+from unittest import mock
+
+from flask import request
+import pytest
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.test import EnvironBuilder
+
+from dmutils import request_body_limit
+from dmutils.documents import DOCUMENT_SIZE_LIMIT
+from dmutils.request_body_limit import (
+    DOCUMENT_UPLOAD_OVERHEAD,
+    LimitedInputStream,
+    RequestBodyLimit,
+    document_upload_limit,
+    limit_request_body,
+)
+
+
+@pytest.fixture
+def upload_app(app):
+    request_body_limit.init_app(app)
+    app.view_calls = []
+
+    @app.route("/upload", methods=["POST"])
+    @limit_request_body(500)
+    def upload():
+        size = len(request.files["document"].read())
+        app.view_calls.append(request.endpoint)
+        return str(size)
+
+    @app.route("/other", methods=["POST"])
+    def other():
+        size = len(request.get_data())
+        app.view_calls.append(request.endpoint)
+        return str(size)
+
+    return app
+
+
+def _upload(client, size):
+    return client.post("/upload", data={"document": (BytesIO(b"x" * size), "a.pdf")})
+
+
+class TestRequestBodyLimit:
+    def test_document_upload_limit(self):
+        assert document_upload_limit() == DOCUMENT_SIZE_LIMIT + DOCUMENT_UPLOAD_OVERHEAD
+        assert document_upload_limit(3) == 3 * DOCUMENT_SIZE_LIMIT + DOCUMENT_UPLOAD_OVERHEAD
+
+    def test_upload_within_limit(self, upload_app):
+        response = _upload(upload_app.test_client(), 10)
+
+        assert response.status_code == 200
+        assert response.data == b"10"
+
+    def test_declared_content_length_over_limit(self, upload_app):
+        with mock.patch.object(upload_app.logger, "warning") as logger_warning:
+            response = _upload(upload_app.test_client(), 1000)
+
+        assert response.status_code == 413
+        assert upload_app.view_calls == []
+        assert logger_warning.call_args[1]["extra"]["request_body_limit"] == 500
+
+    def test_declared_content_length_over_limit_rejected_on_first_read(self, upload_app):
+        input_stream = BytesIO(b"x" * 1000)
+        with upload_app.test_request_context("/upload", method="POST"):
+            stream = LimitedInputStream(input_stream, 100, content_length=1000)
+            with pytest.raises(RequestEntityTooLarge):
+                stream.read(10)
+
+        assert input_stream.tell() == 0
+
+    @pytest.mark.parametrize("read", (
+        lambda stream: stream.read(),
+        lambda stream: stream.read(30),
+        lambda stream: stream.readline(),
+        lambda stream: list(stream),
+    ))
+    def test_streamed_body_over_limit(self, upload_app, read):
+        input_stream = BytesIO(b"xxxxxxxxx\n" * 100)
+        with upload_app.test_request_context("/upload", method="POST"):
+            stream = LimitedInputStream(input_stream, 100)
+            with pytest.raises(RequestEntityTooLarge):
+                while read(stream):
+                    pass
+
+        # stops reading one byte past the limit
+        assert input_stream.tell() == 101
+        assert stream.received == 101
+
+    def test_chunked_body_over_limit(self, upload_app):
+        environ = EnvironBuilder(
+            "/upload",
+            method="POST",
+            data={"document": (BytesIO(b"x" * 1000), "a.pdf")},
+            headers={"Transfer-Encoding": "chunked"},
+        ).get_environ()
+        del environ["CONTENT_LENGTH"]
+        environ["wsgi.input_terminated"] = True
+
+        start_response = mock.Mock()
+        b"".join(upload_app.wsgi_app(environ, start_response))
+
+        assert start_response.call_args[0][0].startswith("413")
+        assert upload_app.view_calls == []
+
+    def test_default_limit(self, upload_app):
+        upload_app.config["DM_REQUEST_BODY_LIMIT"] = 50
+        client = upload_app.test_client()
+
+        assert client.post("/other", data=b"x" * 50).status_code == 200
+        assert client.post("/other", data=b"x" * 51).status_code == 413
+        # the decorator overrides the default
+        assert _upload(client, 10).status_code == 200
+
+    def test_no_limit_by_default(self, upload_app):
+        response = upload_app.test_client().post("/other", data=b"x" * 10000)
+
+        assert response.status_code == 200
+        assert response.data == b"10000"
+
+    def test_config_overrides_decorator(self, upload_app):
+        upload_app.config["DM_REQUEST_BODY_LIMITS"] = {"upload": 5000}
+
+        assert _upload(upload_app.test_client(), 1000).status_code == 200
+
+    def test_unroutable_requests_have_default_limit(self, upload_app):
+        upload_app.config["DM_REQUEST_BODY_LIMIT"] = 50
+        client = upload_app.test_client()
+
+        assert client.post("/no-such-page", data=b"x" * 10).status_code == 404
+        assert client.post("/no-such-page", data=b"x" * 100).status_code == 413
+        assert client.put("/upload", data=b"x" * 100).status_code == 413
+
+    def test_endpoint_not_matched_without_any_limits(self, app):
+        request_body_limit.init_app(app)
+        app.add_url_rule("/other", "other", lambda: str(len(request.get_data())), methods=["POST"])
+        client = app.test_client()
+
+        with mock.patch.object(RequestBodyLimit, "_get_endpoint") as _get_endpoint:
+            assert client.post("/other", data=b"x" * 100).data == b"100"
+
+        assert _get_endpoint.called is False
+
+        # a limited view registered later is still noticed
+        @app.route("/upload", methods=["POST"])
+        @limit_request_body(50)
+        def upload():
+            return "ok"
+
+        assert client.post("/upload", data=b"x" * 100).status_code == 413
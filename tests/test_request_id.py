@@ -680,3 +680,51 @@ def test_response_headers_error_response(
 
     assert traceid_random_mock.randrange.called is expect_trace_random_call
     assert spanid_random_mock.randrange.called is False
+
+
+def test_extra_log_context_memoized(app):
+    request_id_init_app(app)
+
+    with app.test_request_context(headers=(("DM-Request-ID", "from-header"), ("X-B3-Sampled", "1"))):
+        with mock.patch.object(
+            RequestIdRequestMixin,
+            "_get_first_header",
+            autospec=True,
+            side_effect=RequestIdRequestMixin._get_first_header,
+        ) as get_first_header:
+            extra_log_context = request.get_extra_log_context()
+            for _ in range(3):
+                assert request.get_extra_log_context() is extra_log_context
+
+        assert get_first_header.call_count == 5
+        assert extra_log_context == AnySupersetOf({"trace_id": "from-header", "is_sampled": "1"})
+
+
+@pytest.mark.parametrize("property_name, value, expected_context", (
+    ("trace_id", "new-trace", {"trace_id": "new-trace"}),
+    ("span_id", "new-span", {"span_id": "new-span"}),
+    ("parent_span_id", "new-parent", {"parent_span_id": "new-parent"}),
+    ("is_sampled", False, {"is_sampled": "0"}),
+    ("debug_flag", True, {"debug_flag": "1"}),
+))
+def test_extra_log_context_invalidated_by_setting_trace_property(app, property_name, value, expected_context):
+    request_id_init_app(app)
+
+    with app.test_request_context(headers=(("DM-Request-ID", "from-header"), ("X-B3-Sampled", "1"))):
+        assert request.get_extra_log_context() == AnySupersetOf({"trace_id": "from-header", "is_sampled": "1"})
+
+        setattr(request, property_name, value)
+
+        assert getattr(request, property_name) == value
+        assert request.get_extra_log_context() == AnySupersetOf(expected_context)
+
+
+def test_invalidate_extra_log_context(app):
+    request_id_init_app(app)
+
+    with app.test_request_context(headers=(("DM-Request-ID", "from-header"),)):
+        extra_log_context = request.get_extra_log_context()
+        request.invalidate_extra_log_context()
+
+        assert request.get_extra_log_context() is not extra_log_context
+        assert request.get_extra_log_context() == extra_log_context
@@ -0,0 +1,129 @@
+from io import BytesIO
+from unittest import mock
+import threading
+import zipfile
+
+from botocore.exceptions import ClientError
+import pytest
+
+from dmutils.s3 import S3
+from dmutils.s3_archive import iter_zip, save_zip, zip_streaming_response
+
+
+@pytest.fixture
+def bucket_with_documents(empty_bucket):
+    for i in range(6):
+        empty_bucket.Object(f"g-cloud-12/documents/712345/{i}-pricing-document.pdf").put(
+            Body=bytes([i]) * (1000 * (i + 1)),
+        )
+    empty_bucket.Object("g-cloud-12/documents/712345/").put(Body=b"")
+    empty_bucket.Object("g-cloud-12/documents/999999/0-pricing-document.pdf").put(Body=b"someone else's")
+    yield empty_bucket
+
+
+def _read_zip(data):
+    with zipfile.ZipFile(BytesIO(data)) as zip_file:
+        assert zip_file.testzip() is None
+        return {info.filename: zip_file.read(info) for info in zip_file.infolist()}
+
+
+@pytest.mark.usefixtures("s3_mock")
+class TestIterZip:
+    @pytest.mark.parametrize("max_workers", (1, 3))
+    def test_prefix(self, bucket_with_documents, max_workers):
+        chunks = list(iter_zip(
+            S3("dear-liza"), prefix="/g-cloud-12/documents/712345/", max_workers=max_workers, chunk_size=256,
+        ))
+
+        assert all(chunks)
+        assert _read_zip(b"".join(chunks)) == {
+            f"{i}-pricing-document.pdf": bytes([i]) * (1000 * (i + 1))
+            for i in range(6)
+        }
+
+    def test_paths(self, bucket_with_documents):
+        data = b"".join(iter_zip(S3("dear-liza"), paths=(
+            "g-cloud-12/documents/999999/0-pricing-document.pdf",
+            "/g-cloud-12/documents/712345/1-pricing-document.pdf",
+        )))
+
+        assert _read_zip(data) == {
+            "g-cloud-12/documents/999999/0-pricing-document.pdf": b"someone else's",
+            "g-cloud-12/documents/712345/1-pricing-document.pdf": b"\x01" * 2000,
+        }
+
+    def test_compression(self, bucket_with_documents):
+        data = b"".join(iter_zip(
+            S3("dear-liza"), prefix="g-cloud-12/documents/712345", compression=zipfile.ZIP_DEFLATED,
+        ))
+
+        assert len(data) < 1000
+        assert len(_read_zip(data)) == 6
+
+    def test_empty_prefix_gives_empty_archive(self, bucket_with_documents):
+        assert _read_zip(b"".join(iter_zip(S3("dear-liza"), prefix="g-cloud-11/"))) == {}
+
+    @pytest.mark.parametrize("kwargs", ({}, {"prefix": "foo", "paths": ["bar"]}))
+    def test_requires_prefix_or_paths(self, bucket_with_documents, kwargs):
+        with pytest.raises(TypeError):
+            next(iter_zip(S3("dear-liza"), **kwargs))
+
+    def test_missing_object_raises(self, bucket_with_documents):
+        with pytest.raises(ClientError):
+            b"".join(iter_zip(S3("dear-liza"), paths=(
+                "g-cloud-12/documents/712345/1-pricing-document.pdf",
+                "g-cloud-12/documents/712345/no-such-document.pdf",
+            )))
+
+    def test_prefetching_is_bounded(self, bucket_with_documents):
+        s3 = S3("dear-liza")
+        get_object_calls = []
+        s3._resource.meta.client.meta.events.register(
+            "before-call.s3.GetObject",
+            lambda **kwargs: get_object_calls.append(kwargs["params"]["url_path"]),
+        )
+
+        zip_chunks = iter_zip(s3, prefix="g-cloud-12/documents/712345/", max_workers=2, chunk_size=100)
+        next(zip_chunks)
+
+        # only the first object has been consumed from, so only up to max_workers objects should have been fetched
+        assert len(get_object_calls) <= 2
+        zip_chunks.close()
+
+    def test_abandoned_archive_stops_fetchers(self, bucket_with_documents):
+        threads_before = threading.active_count()
+        zip_chunks = iter_zip(
+            S3("dear-liza"), prefix="g-cloud-12/documents/712345/", max_workers=3, chunk_size=10, prefetch_chunks=1,
+        )
+        next(zip_chunks)
+        zip_chunks.close()
+
+        assert threading.active_count() == threads_before
+
+
+@pytest.mark.usefixtures("s3_mock")
+def test_zip_streaming_response(bucket_with_documents):
+    response = zip_streaming_response(
+        S3("dear-liza"), prefix="g-cloud-12/documents/712345/", download_filename="712345-documents.zip",
+    )
+
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/zip"
+    assert response.headers["Content-Disposition"] == 'attachment; filename="712345-documents.zip"'
+    assert response.is_streamed
+    assert len(_read_zip(b"".join(response.response))) == 6
+
+
+@pytest.mark.usefixtures("s3_mock")
+def test_save_zip(bucket_with_documents):
+    s3 = S3("dear-liza")
+    with mock.patch.object(s3, "save", side_effect=AssertionError("save needs a seekable file")):
+        key = save_zip(
+            s3, s3, "/g-cloud-12/archives/712345.zip",
+            prefix="g-cloud-12/documents/712345/", download_filename="712345-documents.zip",
+        )
+
+    assert key["path"] == "g-cloud-12/archives/712345.zip"
+    obj = bucket_with_documents.Object("g-cloud-12/archives/712345.zip")
+    assert obj.content_disposition == 'attachment; filename="712345-documents.zip"'
+    assert len(_read_zip(obj.get()["Body"].read())) == 6
@@ -0,0 +1,118 @@
+from collections import Counter
+from io import BytesIO
+import datetime
+
+from botocore.exceptions import ClientError
+import flask
+from freezegun import freeze_time
+import pytest
+
+from dmutils.s3 import S3
+from dmutils.s3_local import LocalS3
+
+
+def _document_flow(s3):
+    """Exercise a range of methods, returning everything they return"""
+    results = [
+        s3.save("/g-cloud-12/documents/1/a.pdf", BytesIO(b"one two three"), download_filename="a.pdf"),
+        s3.save(
+            "g-cloud-12/documents/1/b/c.odt", BytesIO(b"four five"), acl="bucket-owner-full-control",
+            timestamp=datetime.datetime(2019, 6, 7, 8, 9),
+        ),
+        s3.save("g-cloud-12/documents/2/d.pdf", BytesIO(b"six")),
+        s3.get_key("g-cloud-12/documents/1/a.pdf"),
+        s3.get_key("g-cloud-12/documents/1/no-such.pdf"),
+        s3.path_exists("/g-cloud-12/documents/1/b/c.odt"),
+        s3.path_exists("g-cloud-12/documents/1/b"),
+        s3.list("g-cloud-12/documents/1/"),
+        s3.list("g-cloud-12/documents/1/", delimiter="/"),
+        s3.list("g-cloud-12/", load_timestamps=True),
+        list(s3.iter_list("g-cloud-12/documents/", start_after="g-cloud-12/documents/1/a.pdf")),
+        list(s3.iter_list("g-cloud-12/documents/", max_keys=2)),
+        list(s3.iter_list("g-cloud-13/")),
+        s3.copy("dear-liza", "g-cloud-12/documents/1/a.pdf", "g-cloud-12/copies/a.pdf"),
+        b"".join(s3.iter_chunks("g-cloud-12/copies/a.pdf", chunk_size=4, byte_range=(4, 6))),
+        b"".join(s3.iter_chunks("g-cloud-12/copies/a.pdf", chunk_size=4, byte_range=(4, None))),
+        s3.delete_key("g-cloud-12/documents/2/d.pdf"),
+        s3.get_key("g-cloud-12/documents/2/d.pdf"),
+        s3.delete_keys(["g-cloud-12/copies/a.pdf", "/g-cloud-12/documents/1/b/c.odt"]),
+        s3.list(),
+    ]
+
+    with pytest.raises(ValueError):
+        s3.copy("dear-liza", "g-cloud-12/documents/1/a.pdf", "g-cloud-12/documents/1/a.pdf")
+    with pytest.raises(ClientError):
+        s3.copy("dear-liza", "g-cloud-12/no-such.pdf", "g-cloud-12/copies/no-such.pdf")
+    with pytest.raises(ClientError):
+        s3.iter_chunks("g-cloud-12/no-such.pdf")
+
+    return results
+
+
+class TestLocalS3:
+    @pytest.fixture
+    def local_s3(self, tmp_path):
+        return LocalS3("dear-liza", str(tmp_path))
+
+    @freeze_time("2020-01-02 03:04:05")
+    @pytest.mark.usefixtures("s3_mock")
+    def test_same_results_and_calls_as_s3(self, empty_bucket, local_s3):
+        s3 = S3("dear-liza")
+        s3_calls = Counter()
+        s3._resource.meta.client.meta.events.register(
+            "before-call.s3", lambda model, **kwargs: s3_calls.update((model.name,)),
+        )
+
+        assert _document_flow(local_s3) == _document_flow(s3)
+        assert local_s3.calls == s3_calls
+
+    def test_metadata_sidecar(self, local_s3, tmp_path):
+        local_s3.save("a/b.pdf", BytesIO(b"contents"), acl="private", download_filename="b.pdf")
+
+        assert (tmp_path / "dear-liza" / "objects" / "a" / "b.pdf").read_bytes() == b"contents"
+        assert (tmp_path / "dear-liza" / "metadata" / "a" / "b.pdf.json").exists()
+        sidecar = local_s3._read_sidecar("a/b.pdf")
+        assert sidecar["acl"] == "private"
+        assert sidecar["content_type"] == "application/pdf"
+        assert sidecar["content_disposition"] == 'attachment; filename="b.pdf"'
+
+    def test_counts_calls(self, local_s3):
+        local_s3.save("a/b.pdf", BytesIO(b"contents"))
+        local_s3.list("a/", load_timestamps=True)
+
+        assert local_s3.calls == {"PutObject": 1, "HeadObject": 2, "ListObjects": 1}
+
+    def test_get_signed_url(self, local_s3, tmp_path):
+        local_s3.save("a/b.pdf", BytesIO(b"contents"))
+
+        with freeze_time("2020-01-01"):
+            assert local_s3.get_signed_url("a/b.pdf", expires_in=10) == (
+                f"{(tmp_path / 'dear-liza' / 'objects' / 'a' / 'b.pdf').as_uri()}?Expires=1577836810"
+            )
+        assert local_s3.get_signed_url("a/no-such.pdf") is None
+        assert local_s3.calls["Presign"] == 1
+
+    def test_get_signed_url_with_base_url(self, tmp_path):
+        local_s3 = LocalS3("dear-liza", str(tmp_path), base_url="http://localhost:5000/")
+        local_s3.save("a/b.pdf", BytesIO(b"contents"))
+
+        with freeze_time("2020-01-01"):
+            assert local_s3.get_signed_url("a/b.pdf", expires_in=10) == (
+                "http://localhost:5000/dear-liza/a/b.pdf?Expires=1577836810"
+            )
+
+    def test_selected_by_flask_config(self, tmp_path):
+        app = flask.Flask("test_selected_by_flask_config")
+        app.config["DM_S3_BACKEND"] = "local"
+        app.config["DM_S3_LOCAL_ROOT"] = str(tmp_path)
+
+        with app.app_context():
+            s3 = S3("dear-liza")
+
+        assert isinstance(s3, LocalS3)
+        assert s3.bucket_name == "dear-liza"
+
+    @pytest.mark.usefixtures("s3_mock")
+    def test_not_selected_by_default(self):
+        with flask.Flask("test_not_selected_by_default").app_context():
+            assert isinstance(S3("dear-liza"), S3)
@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from dmutils.formats import DATETIME_FORMAT
+from dmutils.s3 import S3
+from dmutils.s3_manifest import S3PrefixManifest
+
+
+@pytest.fixture
+def bucket_with_documents(empty_bucket):
+    for i in range(10):
+        empty_bucket.Object(f"g-cloud-12/documents/712345/{i}-pricing-document.pdf").put(Body=b"*" * i)
+    empty_bucket.Object("g-cloud-11/documents/712345/0-pricing-document.pdf").put(Body=b"elsewhere")
+    yield empty_bucket
+
+
+def _document_key(i):
+    return f"g-cloud-12/documents/712345/{i}-pricing-document.pdf"
+
+
+@pytest.mark.usefixtures("s3_mock")
+class TestS3PrefixManifest:
+    @pytest.fixture(autouse=True)
+    def _manifest_path(self, tmp_path):
+        self.manifest_path = str(tmp_path / "manifest.json")
+
+    def _manifest(self, **kwargs):
+        return S3PrefixManifest(S3("dear-liza"), "/g-cloud-12/documents/", self.manifest_path, **kwargs)
+
+    def _count_list_calls(self, manifest):
+        list_calls = []
+        manifest._s3._resource.meta.client.meta.events.register(
+            "before-call.s3.ListObjectsV2",
+            lambda **kwargs: list_calls.append(kwargs["params"]["query_string"].get("start-after")),
+        )
+        return list_calls
+
+    def test_initial_refresh(self, bucket_with_documents):
+        manifest = self._manifest()
+
+        assert manifest.refresh() == {
+            "added": [_document_key(i) for i in range(10)],
+            "changed": [],
+            "removed": [],
+        }
+        assert len(manifest) == 10
+        obj = bucket_with_documents.Object(_document_key(3))
+        assert manifest.get(_document_key(3)) == {
+            "size": 3,
+            "etag": obj.e_tag.strip('"'),
+            "last_modified": obj.last_modified.strftime(DATETIME_FORMAT),
+        }
+        assert _document_key(3) in manifest
+        assert manifest.get("g-cloud-11/documents/712345/0-pricing-document.pdf") is None
+
+    def test_manifest_is_persisted(self, bucket_with_documents):
+        self._manifest().refresh()
+
+        with open(self.manifest_path) as f:
+            assert len(json.load(f)["keys"]) == 10
+
+        manifest = self._manifest()
+        assert manifest.keys() == [_document_key(i) for i in range(10)]
+        assert manifest.refresh() == {"added": [], "changed": [], "removed": []}
+
+    def test_manifest_for_other_prefix_is_ignored(self, bucket_with_documents):
+        self._manifest().refresh()
+
+        manifest = S3PrefixManifest(S3("dear-liza"), "g-cloud-12/documents/712345/1", self.manifest_path)
+        assert len(manifest) == 0
+        assert manifest.refresh()["added"] == [_document_key(1)]
+
+    def test_incremental_refresh_only_lists_recheck_window_onwards(self, bucket_with_documents):
+        self._manifest(recheck_window=3).refresh()
+        bucket_with_documents.Object(_document_key(1)).delete()
+        bucket_with_documents.Object(_document_key(8)).delete()
+        bucket_with_documents.Object(_document_key(9)).put(Body=b"changed")
+        bucket_with_documents.Object("g-cloud-12/documents/800000/0-pricing-document.pdf").put(Body=b"new")
+
+        manifest = self._manifest(recheck_window=3)
+        list_calls = self._count_list_calls(manifest)
+
+        assert manifest.refresh() == {
+            "added": ["g-cloud-12/documents/800000/0-pricing-document.pdf"],
+            "changed": [_document_key(9)],
+            "removed": [_document_key(8)],
+        }
+        assert list_calls == [_document_key(6)]
+        # the removal of a key before the recheck window goes unnoticed until a full refresh
+        assert _document_key(1) in manifest
+        assert len(manifest) == 10
+
+        assert manifest.refresh(full=True) == {"added": [], "changed": [], "removed": [_document_key(1)]}
+        assert manifest.keys() == [
+            *(_document_key(i) for i in (0, 2, 3, 4, 5, 6, 7, 9)),
+            "g-cloud-12/documents/800000/0-pricing-document.pdf",
+        ]
+
+    def test_incremental_refresh_misses_additions_before_recheck_window(self, bucket_with_documents):
+        self._manifest(recheck_window=3).refresh()
+        # sorts before all of supplier 712345's documents
+        bucket_with_documents.Object("g-cloud-12/documents/100000/0-pricing-document.pdf").put(Body=b"new")
+
+        manifest = self._manifest(recheck_window=3)
+
+        assert manifest.refresh() == {"added": [], "changed": [], "removed": []}
+        assert "g-cloud-12/documents/100000/0-pricing-document.pdf" not in manifest
+
+        assert manifest.refresh(full=True) == {
+            "added": ["g-cloud-12/documents/100000/0-pricing-document.pdf"],
+            "changed": [],
+            "removed": [],
+        }
+        assert manifest.keys()[0] == "g-cloud-12/documents/100000/0-pricing-document.pdf"
+
+    def test_small_manifest_is_fully_refreshed(self, bucket_with_documents):
+        self._manifest().refresh()
+        bucket_with_documents.Object(_document_key(1)).delete()
+
+        manifest = self._manifest()
+        list_calls = self._count_list_calls(manifest)
+
+        assert manifest.refresh()["removed"] == [_document_key(1)]
+        assert list_calls == [None]
@@ -0,0 +1,177 @@
+from io import BytesIO
+import os
+import subprocess
+import sys
+from unittest import mock
+
+from botocore.exceptions import EndpointConnectionError
+import flask
+import prometheus_client
+import pytest
+
+from dmutils.s3 import S3
+from dmutils import s3_metrics
+from dmutils.s3_metrics import get_request_s3_summary
+
+
+def _sample(name, **labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def s3_metrics_enabled():
+    with mock.patch.object(s3_metrics, "_enabled", False):
+        s3_metrics.enable_s3_metrics()
+        yield
+
+
+@pytest.mark.usefixtures("s3_mock")
+class TestS3MetricsOptIn:
+    def test_importing_s3_does_not_import_gds_metrics(self):
+        env = {
+            key: value for key, value in os.environ.items()
+            if key.lower() != "prometheus_multiproc_dir"
+        }
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import os, sys, dmutils.s3; "
+                "assert 'gds_metrics' not in sys.modules; "
+                "assert 'prometheus_multiproc_dir' not in os.environ",
+            ],
+            env=env,
+            check=True,
+        )
+
+    def test_requests_not_recorded_by_default(self, empty_bucket):
+        before = _sample("dm_s3_requests_total", operation="PutObject", bucket="dear-liza", status="200")
+
+        with flask.Flask("test_requests_not_recorded_by_default").app_context():
+            s3 = S3("dear-liza")
+            s3.save("with/straw.dear.pdf", BytesIO(b"one two three"))
+            s3.get_signed_url("with/straw.dear.pdf")
+
+            assert get_request_s3_summary() == {}
+
+        assert s3_metrics.s3_metrics_enabled() is False
+        assert _sample("dm_s3_requests_total", operation="PutObject", bucket="dear-liza", status="200") == before
+
+    def test_enabled_by_config(self, empty_bucket):
+        app = flask.Flask("test_enabled_by_config")
+        app.config["DM_S3_METRICS"] = True
+        before = _sample("dm_s3_requests_total", operation="PutObject", bucket="dear-liza", status="200")
+
+        with mock.patch.object(s3_metrics, "_enabled", False):
+            with app.app_context():
+                S3("dear-liza").save("with/straw.dear.pdf", BytesIO(b"one two three"))
+
+                assert s3_metrics.s3_metrics_enabled() is True
+                assert get_request_s3_summary()["PutObject"]["count"] == 1
+
+        assert _sample("dm_s3_requests_total", operation="PutObject", bucket="dear-liza", status="200") == before + 1
+
+
+@pytest.mark.usefixtures("s3_mock", "s3_metrics_enabled")
+class TestS3Metrics:
+    def test_operations_are_counted(self, empty_bucket):
+        s3 = S3("dear-liza")
+        before = {
+            operation: _sample("dm_s3_requests_total", operation=operation, bucket="dear-liza", status="200")
+            for operation in ("PutObject", "HeadObject", "ListObjectsV2", "GetObject", "Presign")
+        }
+
+        s3.save("with/straw.dear.pdf", BytesIO(b"one two three"))
+        s3.get_key("with/straw.dear.pdf")
+        list(s3.iter_list("with/"))
+        b"".join(s3.iter_chunks("with/straw.dear.pdf"))
+        s3.get_signed_url("with/straw.dear.pdf")
+
+        assert {
+            operation: _sample("dm_s3_requests_total", operation=operation, bucket="dear-liza", status="200") - count
+            for operation, count in before.items()
+        } == {
+            "PutObject": 1,
+            # from loading the saved key's metadata, get_key and get_signed_url
+            "HeadObject": 3,
+            "ListObjectsV2": 1,
+            "GetObject": 1,
+            "Presign": 1,
+        }
+
+    def test_failed_requests_are_counted_by_status(self, empty_bucket):
+        before = _sample("dm_s3_requests_total", operation="HeadObject", bucket="dear-liza", status="404")
+
+        assert S3("dear-liza").get_key("no/such.pdf") is None
+
+        assert _sample("dm_s3_requests_total", operation="HeadObject", bucket="dear-liza", status="404") == before + 1
+
+    def test_connection_errors_are_counted(self, empty_bucket):
+        s3 = S3("dear-liza")
+        before = _sample("dm_s3_requests_total", operation="GetObject", bucket="dear-liza", status="error")
+
+        with mock.patch.object(
+            s3._resource.meta.client._endpoint,
+            "make_request",
+            side_effect=EndpointConnectionError(endpoint_url="https://s3.example.com"),
+        ):
+            with pytest.raises(EndpointConnectionError):
+                b"".join(s3.iter_chunks("with/straw.dear.pdf"))
+
+        assert _sample("dm_s3_requests_total", operation="GetObject", bucket="dear-liza", status="error") == before + 1
+
+    def test_durations_and_bytes_are_recorded(self, empty_bucket):
+        s3 = S3("dear-liza")
+        duration_count = _sample("dm_s3_request_duration_seconds_count", operation="PutObject", bucket="dear-liza")
+        uploaded = _sample(
+            "dm_s3_transferred_bytes_total", operation="PutObject", bucket="dear-liza", direction="upload",
+        )
+        downloaded = _sample(
+            "dm_s3_transferred_bytes_total", operation="GetObject", bucket="dear-liza", direction="download",
+        )
+
+        s3.save("with/straw.dear.pdf", BytesIO(b"one two three"))
+        b"".join(s3.iter_chunks("with/straw.dear.pdf", byte_range=(4, 6)))
+
+        assert _sample(
+            "dm_s3_request_duration_seconds_count", operation="PutObject", bucket="dear-liza",
+        ) == duration_count + 1
+        assert _sample(
+            "dm_s3_transferred_bytes_total", operation="PutObject", bucket="dear-liza", direction="upload",
+        ) == uploaded + 13
+        assert _sample(
+            "dm_s3_transferred_bytes_total", operation="GetObject", bucket="dear-liza", direction="download",
+        ) == downloaded + 3
+
+    def test_request_summary(self, empty_bucket):
+        app = flask.Flask("test_request_summary")
+        s3_metrics.init_app(app)
+
+        @app.route("/")
+        def index():
+            s3 = S3("dear-liza")
+            for i in range(3):
+                s3.get_key(f"with/straw{i}.dear.pdf")
+            assert get_request_s3_summary()["HeadObject"]["count"] == 3
+            return "ok"
+
+        with mock.patch.object(app.logger, "info") as logger_info:
+            assert app.test_client().get("/").status_code == 200
+
+        logger_info.assert_called_once_with(
+            "S3 usage for {method} {url}: {s3_request_count} requests taking {s3_duration}s",
+            extra=mock.ANY,
+        )
+        extra = logger_info.call_args[1]["extra"]
+        assert extra["s3_request_count"] == 3
+        assert extra["s3_operations"] == {"HeadObject": {"count": 3, "duration": mock.ANY, "bytes": 0}}
+
+    def test_no_request_summary_without_s3_requests(self):
+        app = flask.Flask("test_no_request_summary_without_s3_requests")
+        s3_metrics.init_app(app)
+        app.add_url_rule("/", "index", lambda: "ok")
+
+        with mock.patch.object(app.logger, "info") as logger_info:
+            assert app.test_client().get("/").status_code == 200
+
+        assert logger_info.called is False